@@ -1,9 +1,19 @@
 import os
+import pickle
 import sys
 import unittest
 import subprocess
 import hashlib
+import io
+import math
+import multiprocessing
+import shutil
 import string
+import tarfile
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "./trdg")))
 
@@ -12,10 +22,39 @@ try:
 except:
     pass
 
+from bidi.algorithm import get_display
 from diffimg import diff
 
-from trdg.data_generator import FakeTextDataGenerator
-from trdg import background_generator
+from trdg.config import FIELDS, GenerationConfig
+from trdg.data_generator import (
+    FakeTextDataGenerator,
+    contrast_stats,
+    contrasting_color,
+    format_contrast_stats,
+)
+from trdg.manifest import (
+    LabelsWriter,
+    ManifestWriter,
+    manifest_path,
+    merge_manifests,
+    read_manifest,
+)
+from trdg.pack import INDEX_ENTRY, PackReader, PackWriter, write_index
+from trdg.profiling import merge_profiles, prepare_profile_dir, start_worker_profile
+from trdg.timing import StageTimer, StageTimings, format_timings
+from trdg.transform import rotate_and_resize
+from trdg.run import compute_chunksize
+from trdg.utils import (
+    derive_seed,
+    label_map_to_bboxes,
+    label_map_to_mask,
+    mask_to_bboxes,
+    mask_to_label_map,
+    shard_range,
+)
+from trdg.writer import InFlightLimit, SampleWriter, TarShardWriter
+from trdg import background_generator, computer_text_generator
+from trdg.benchmark import compare_matrix, format_results, run_benchmark, run_stages
 from trdg.generators import (
     GeneratorFromDict,
     GeneratorFromRandom,
@@ -27,6 +66,7 @@ from trdg.string_generator import (
     create_strings_from_dict,
     create_strings_from_wikipedia,
     create_strings_randomly,
+    iterate_strings_from_file,
 )
 
 
@@ -68,6 +108,159 @@ class Generators(unittest.TestCase):
             self.assertTrue(img.size[1] == 32, "Shape is not right")
             i += 1
 
+    def test_generator_from_strings_with_seed(self):
+        def images(seed):
+            generator = GeneratorFromStrings(
+                ["TEST TEST TEST"],
+                count=3,
+                fonts=["tests/font.ttf"],
+                skewing_angle=10,
+                random_skew=True,
+                distorsion_type=3,
+                text_color="#000000,#888888",
+                seed=seed,
+            )
+            return [img.tobytes() for img, _ in generator]
+
+        self.assertEqual(images(42), images(42))
+        self.assertNotEqual(images(42), images(43))
+        # Sample i is seeded from (seed, i) as in run.py
+        config = GenerationConfig(
+            skewing_angle=10,
+            random_skew=True,
+            distorsion_type=3,
+            text_color="#000000,#888888",
+        )
+        self.assertEqual(
+            images(42),
+            [
+                FakeTextDataGenerator.generate_from_config(
+                    i, "TEST TEST TEST", "tests/font.ttf", config, derive_seed(42, i)
+                ).tobytes()
+                for i in range(3)
+            ],
+        )
+
+    def test_generator_from_strings_with_config(self):
+        config = GenerationConfig(
+            skewing_angle=10,
+            random_skew=True,
+            distorsion_type=3,
+            text_color="#000000,#888888",
+        )
+        generator = GeneratorFromStrings(
+            ["TEST TEST TEST"], count=2, fonts=["tests/font.ttf"], seed=42
+        )
+        configured = GeneratorFromStrings(
+            ["TEST TEST TEST"],
+            count=2,
+            fonts=["tests/font.ttf"],
+            seed=42,
+            config=config,
+        )
+        self.assertNotEqual(
+            [img.tobytes() for img, _ in generator],
+            [img.tobytes() for img, _ in configured],
+        )
+        self.assertEqual(configured.config, config)
+
+    def test_generator_from_strings_with_numpy_output(self):
+        def samples(**kwargs):
+            return list(
+                GeneratorFromStrings(
+                    ["TEST TEST", "TEST"],
+                    count=2,
+                    fonts=["tests/font.ttf"],
+                    skewing_angle=5,
+                    random_skew=True,
+                    output_mask=True,
+                    seed=5,
+                    **kwargs
+                )
+            )
+
+        for ((img, mask), lbl), ((arr, label_map), arr_lbl) in zip(
+            samples(), samples(output="numpy")
+        ):
+            self.assertEqual(lbl, arr_lbl)
+            self.assertEqual(arr.dtype, np.uint8)
+            self.assertEqual(arr.shape, (img.size[1], img.size[0], 3))
+            self.assertTrue((arr == np.asarray(img)).all())
+            self.assertEqual(label_map.dtype, np.uint16)
+            self.assertEqual(label_map.shape, arr.shape[:2])
+            # One label per character, spaces included
+            self.assertEqual(int(label_map.max()), len(lbl))
+
+        self.assertRaises(
+            ValueError,
+            GeneratorFromStrings,
+            ["TEST"],
+            fonts=["tests/font.ttf"],
+            output="tensor",
+        )
+
+    def test_generator_next_batch(self):
+        def generator(**kwargs):
+            return GeneratorFromStrings(
+                ["TEST TEST", "TEST", "TEST TEST TEST"],
+                count=5,
+                fonts=["tests/font.ttf"],
+                seed=3,
+                **kwargs
+            )
+
+        images = list(generator())
+        batch, widths, labels = generator().next_batch(3)
+        self.assertEqual(batch.dtype, np.uint8)
+        self.assertEqual(batch.shape, (3, 32, max(widths), 3))
+        self.assertEqual(labels, [lbl for _, lbl in images[:3]])
+        for i, (img, _) in enumerate(images[:3]):
+            self.assertEqual(widths[i], img.size[0])
+            self.assertTrue((batch[i, :, : widths[i]] == np.asarray(img)).all())
+            self.assertFalse(batch[i, :, widths[i] :].any())
+
+        # The last batch is short, then the generator is exhausted
+        padded = generator(image_mode="L")
+        batch, widths, labels = padded.next_batch(3, pad_to=300)
+        self.assertEqual(batch.shape, (3, 32, 300, 1))
+        batch, widths, labels = padded.next_batch(3, pad_to=300)
+        self.assertEqual(len(batch), 2)
+        self.assertEqual(len(widths), 2)
+        self.assertRaises(StopIteration, padded.next_batch, 3)
+        # The channels are those of the mode, not the length of its name
+        batch, _, _ = generator(image_mode="YCbCr").next_batch(2, pad_to=300)
+        self.assertEqual(batch.shape, (2, 32, 300, 3))
+        batch, _, _ = generator(image_mode="LA").next_batch(2)
+        self.assertEqual(batch.shape[3], 2)
+
+        self.assertRaises(ValueError, generator().next_batch, 1, pad_to=10)
+
+    def test_mask_to_label_map(self):
+        mask = Image.new("RGB", (300, 1))
+        for i in range(300):
+            mask.putpixel((i, 0), (0, (i + 1) // 255, (i + 1) % 255))
+        self.assertEqual(mask_to_label_map(mask).tolist(), [list(range(1, 301))])
+
+    def test_generator_from_strings_with_shards(self):
+        def samples(**kwargs):
+            generator = GeneratorFromStrings(
+                ["TEST", "TEST TEST", "TEST TEST TEST"],
+                count=7,
+                fonts=["tests/font.ttf"],
+                random_skew=True,
+                skewing_angle=5,
+                seed=1,
+                **kwargs
+            )
+            return [(img.tobytes(), lbl) for img, lbl in generator]
+
+        self.assertEqual(
+            samples(),
+            samples(shard_index=0, shard_count=3)
+            + samples(shard_index=1, shard_count=3)
+            + samples(shard_index=2, shard_count=3),
+        )
+
     def test_generator_from_dict_stops(self):
         generator = GeneratorFromDict(count=1)
         next(generator)
@@ -112,6 +305,12 @@ class DataGenerator(unittest.TestCase):
             len(strings) == 6 and strings[0] != strings[1] and strings[0] == strings[3]
         )
 
+    def test_iterate_strings_from_file(self):
+        strings = iterate_strings_from_file("tests/test.txt", 6)
+
+        self.assertFalse(isinstance(strings, list))
+        self.assertEqual(list(strings), create_strings_from_file("tests/test.txt", 6))
+
     def test_create_strings_from_dict(self):
         strings = create_strings_from_dict(
             3, False, 2, ["TEST", "TEST", "TEST", "TEST"]
@@ -1250,6 +1449,857 @@ class DataGenerator(unittest.TestCase):
 
         self.assertTrue(len(bkgd.histogram()) > 20 and bkgd.size == (128, 64))
 
+    def test_generate_data_with_preloaded_image_background(self):
+        image_dir = os.path.join(
+            os.path.split(os.path.realpath(__file__))[0], "trdg/images"
+        )
+        background_generator.preload_images(image_dir)
+        bkgd = background_generator.image(64, 128, image_dir)
+
+        self.assertTrue(bkgd.size == (128, 64))
+        self.assertEqual(background_generator._list_images.cache_info().misses, 1)
+
+    def test_preload_images_fills_the_cache_only(self):
+        os.mkdir("tests/out/backgrounds")
+        count = background_generator.IMAGE_CACHE_SIZE + 2
+        for i in range(count):
+            Image.new("RGB", (8, 8)).save("tests/out/backgrounds/{:03d}.png".format(i))
+        background_generator.preload_images("tests/out/backgrounds")
+
+        info = background_generator._load_image.cache_info()
+        self.assertEqual(info.misses, background_generator.IMAGE_CACHE_SIZE)
+        self.assertEqual(info.currsize, background_generator.IMAGE_CACHE_SIZE)
+        # A new image is listed once the cache is cleared
+        Image.new("RGB", (8, 8)).save("tests/out/backgrounds/new.png")
+        self.assertEqual(
+            len(background_generator._list_images("tests/out/backgrounds")), count
+        )
+        background_generator.clear_image_cache()
+        self.assertEqual(
+            len(background_generator._list_images("tests/out/backgrounds")),
+            count + 1,
+        )
+
+        empty_directory("tests/out/backgrounds")
+        os.rmdir("tests/out/backgrounds")
+
+    def test_compute_chunksize(self):
+        self.assertEqual(compute_chunksize(10, 4), 1)
+        self.assertEqual(compute_chunksize(1600, 4), 100)
+        self.assertEqual(compute_chunksize(50000000, 64), 256)
+
+    def test_shard_range(self):
+        ranges = [shard_range(10, i, 3) for i in range(3)]
+
+        self.assertEqual(ranges, [(0, 3), (3, 6), (6, 10)])
+        self.assertRaises(ValueError, shard_range, 10, 3, 3)
+
+    def test_merge_manifests(self):
+        os.mkdir("tests/out/manifests")
+        for shard_index in range(2):
+            writer = ManifestWriter(manifest_path("tests/out/manifests", shard_index, 2))
+            writer.write({"index": shard_index, "file": "{}.jpg".format(shard_index)})
+            writer.close()
+
+        self.assertEqual(merge_manifests("tests/out/manifests"), 2)
+        self.assertEqual(
+            [r["index"] for r in read_manifest("tests/out/manifests/manifest.jsonl")],
+            [0, 1],
+        )
+
+        os.remove(manifest_path("tests/out/manifests", 1, 2))
+        self.assertRaises(ValueError, merge_manifests, "tests/out/manifests")
+
+        empty_directory("tests/out/manifests")
+        os.rmdir("tests/out/manifests")
+
+    def test_sample_writer(self):
+        os.mkdir("tests/out/writer")
+        manifest = ManifestWriter(manifest_path("tests/out/writer"))
+        writer = SampleWriter("tests/out/writer", 2, 4, manifest.write)
+        for i in range(10):
+            writer.write(
+                [("{}.txt".format(i), str(i).encode("utf8"))],
+                {"index": i, "file": "{}.txt".format(i)},
+            )
+        writer.close()
+        manifest.close()
+
+        for i in range(10):
+            with open("tests/out/writer/{}.txt".format(i), "rb") as f:
+                self.assertEqual(f.read(), str(i).encode("utf8"))
+        self.assertEqual(
+            sorted(r["index"] for r in read_manifest(manifest_path("tests/out/writer"))),
+            list(range(10)),
+        )
+        stats = writer.stats()
+        self.assertEqual(stats["samples"], 10)
+        self.assertTrue(stats["max_queue_depth"] <= 4)
+
+        empty_directory("tests/out/writer")
+        os.rmdir("tests/out/writer")
+
+    def test_in_flight_limit(self):
+        in_flight = InFlightLimit(6)
+        handed = []
+        tasks = (handed.append(i) or i for i in in_flight.limit(range(60)))
+        written = 0
+        buffered = 0
+        with multiprocessing.Pool(2) as p:
+            for _ in p.imap_unordered(abs, tasks, chunksize=2):
+                # A slow writer
+                time.sleep(0.005)
+                buffered = max(buffered, len(handed) - written)
+                written += 1
+                in_flight.release()
+
+        self.assertEqual(written, 60)
+        self.assertTrue(buffered <= 6)
+        self.assertRaises(ValueError, in_flight.release)
+
+    def test_writer_timings(self):
+        os.mkdir("tests/out/timed")
+        writers = [
+            SampleWriter("tests/out/timed", 2, 4, timed=True),
+            TarShardWriter("tests/out/timed", 2, timed=True),
+            PackWriter("tests/out/timed/samples.pack", timed=True),
+        ]
+        timings = StageTimings()
+        timings.add({"render": 0.01})
+        for writer in writers:
+            for i in range(3):
+                writer.write(
+                    [("{}.txt".format(i), str(i).encode("utf8"))],
+                    {"index": i, "file": "{}.txt".format(i), "label": str(i)},
+                )
+            writer.close()
+            timings.merge(writer.timings)
+
+        summary = timings.summary()
+        self.assertEqual(list(summary), ["render", "write"])
+        self.assertEqual(summary["render"]["count"], 1)
+        self.assertEqual(summary["write"]["count"], 9)
+        untimed = SampleWriter("tests/out/timed", 1)
+        untimed.close()
+        self.assertIsNone(untimed.timings)
+
+        empty_directory("tests/out/timed")
+        os.rmdir("tests/out/timed")
+
+    def test_manifest_writer_batches(self):
+        writer = ManifestWriter("tests/out/manifest.jsonl", batch_size=3)
+        for i in range(4):
+            writer.write({"index": i})
+        # Only the first batch is flushed before close
+        self.assertEqual(
+            [r["index"] for r in read_manifest("tests/out/manifest.jsonl")], [0, 1, 2]
+        )
+        writer.close()
+        self.assertEqual(
+            [r["index"] for r in read_manifest("tests/out/manifest.jsonl")],
+            [0, 1, 2, 3],
+        )
+        os.remove("tests/out/manifest.jsonl")
+
+    def test_labels_writer(self):
+        labels = LabelsWriter("tests/out/labels.txt", start=10)
+        for i in (12, 10, 13, 11, 10, 15):
+            labels.write({"index": i, "file": "{}.jpg".format(i), "label": str(i)})
+            # Held until the samples before it are written
+            self.assertLessEqual(len(labels.pending), 2)
+        labels.close()
+        with open("tests/out/labels.txt", "r", encoding="utf8") as f:
+            self.assertEqual(
+                f.read().splitlines(),
+                ["10.jpg 10", "11.jpg 11", "12.jpg 12", "13.jpg 13", "15.jpg 15"],
+            )
+        os.remove("tests/out/labels.txt")
+
+    def test_generation_config(self):
+        config = GenerationConfig(
+            text_color="#000000,#888888", distorsion_type=1, alignment=2, width=100
+        )
+        self.assertEqual(config.text_colors, ((0, 0, 0), (136, 136, 136)))
+        self.assertEqual(config.align(100, 20), 75)
+        self.assertRaises(AttributeError, setattr, config, "size", 64)
+
+        copy = pickle.loads(pickle.dumps(config))
+        self.assertEqual(copy, config)
+        self.assertEqual(copy.align(100, 20), 75)
+        self.assertEqual(config.replace(size=64).size, 64)
+        self.assertEqual(config.replace(size=64).text_colors, config.text_colors)
+        self.assertRaises(TypeError, config.replace, colour="#000000")
+
+        self.assertRaises(ValueError, GenerationConfig, orientation=2)
+        self.assertRaises(ValueError, GenerationConfig, text_color="not a color")
+        self.assertRaises(
+            ValueError, GenerationConfig, is_handwritten=True, orientation=1
+        )
+
+    def test_generate_from_config(self):
+        config = GenerationConfig(
+            skewing_angle=5, random_skew=True, background_type=2, blur=1
+        )
+        image = FakeTextDataGenerator.generate_from_config(
+            0, "TEST TEST TEST", "tests/font.ttf", config, seed=3
+        )
+        self.assertEqual(
+            image.tobytes(),
+            FakeTextDataGenerator.generate(
+                0,
+                "TEST TEST TEST",
+                "tests/font.ttf",
+                *(getattr(config, field) for field in FIELDS),
+                seed=3,
+            ).tobytes(),
+        )
+
+    def test_generate_data_without_mask(self):
+        config = GenerationConfig(
+            skewing_angle=5, random_skew=True, distorsion_type=3, blur=1
+        )
+        image = FakeTextDataGenerator.generate_from_config(
+            0, "TEST TEST TEST", "tests/font.ttf", config, seed=3
+        )
+        image_with_mask, mask = FakeTextDataGenerator.generate_from_config(
+            0, "TEST TEST TEST", "tests/font.ttf", config.replace(output_mask=1), seed=3
+        )
+        self.assertEqual(image.tobytes(), image_with_mask.tobytes())
+        self.assertEqual(mask.size, image.size)
+
+        _, no_mask = computer_text_generator.generate(
+            "TEST",
+            "tests/font.ttf",
+            "#000000",
+            32,
+            0,
+            1,
+            0,
+            True,
+            False,
+            with_mask=False,
+        )
+        self.assertIsNone(no_mask)
+
+    def test_contrasting_color(self):
+        colors = ((255, 255, 255), (16, 32, 48))
+        self.assertEqual(contrasting_color(colors, 250), (16, 32, 48))
+        self.assertEqual(contrasting_color(colors, 20), (255, 255, 255))
+
+    def test_generate_data_recolors_low_contrast_text(self):
+        # Light text on a white background is given the darkest color of its
+        # range instead of being rejected
+        config = GenerationConfig(background_type=1, text_color="#E0E0E0,#FFFFFF")
+        contrast_stats.clear()
+        for seed in range(5):
+            image = FakeTextDataGenerator.generate_from_config(
+                0, "TEST TEST TEST", "tests/font.ttf", config, seed=seed
+            )
+            self.assertIsNotNone(image)
+            self.assertLessEqual(image.convert("L").getextrema()[0], 240)
+        self.assertEqual(contrast_stats["samples"], 5)
+        self.assertGreater(contrast_stats["recolored"], 0)
+        self.assertEqual(contrast_stats["low_contrast"], 0)
+
+    def test_generate_data_keeps_thin_text(self):
+        # No pixel of a very thin font is mostly opaque once resized
+        image = FakeTextDataGenerator.generate_from_config(
+            0,
+            "eyT",
+            "trdg/fonts/latin/Raleway-Thin.ttf",
+            GenerationConfig(),
+            seed=1,
+        )
+        self.assertIsNotNone(image)
+
+    def test_generate_data_keeps_low_contrast_text(self):
+        # Nothing can be done for white text on a white background, the
+        # sample is still delivered and counted
+        config = GenerationConfig(background_type=1, text_color="#FFFFFF")
+        contrast_stats.clear()
+        image = FakeTextDataGenerator.generate_from_config(
+            0, "TEST", "tests/font.ttf", config, seed=0
+        )
+        self.assertIsNotNone(image)
+        self.assertEqual(contrast_stats["low_contrast"], 1)
+        self.assertEqual(contrast_stats["background_redrawn"], 2)
+        self.assertIn("1 kept with a low contrast", format_contrast_stats(contrast_stats))
+
+    def test_rotate_and_resize(self):
+        image, mask = computer_text_generator.generate(
+            "TEST TEST", "tests/font.ttf", "#000000", 32, 0, 1, 0, False, False
+        )
+        for angle in (0, 3, -7):
+            rotated = image.rotate(angle, expand=1)
+            width = int(rotated.size[0] * (22.0 / rotated.size[1]))
+            fast_image, fast_mask = rotate_and_resize(image, mask, angle, 22, 0)
+            self.assertEqual(fast_image.size, (width, 22))
+            self.assertEqual(fast_image.mode, "RGBA")
+            self.assertEqual(fast_mask.size, (width, 22))
+            self.assertEqual(fast_mask.mode, mask.mode)
+            # The character colors of the mask are not interpolated
+            colors = {c for _, c in fast_mask.getcolors()}
+            self.assertTrue(
+                colors <= {c for _, c in mask.rotate(angle, expand=1).getcolors()}
+            )
+
+        fast_image, no_mask = rotate_and_resize(image, None, 5, 22, 1)
+        self.assertEqual(fast_image.size[0], 22)
+        self.assertIsNone(no_mask)
+
+    def test_generate_data_with_fast_transform(self):
+        config = GenerationConfig(skewing_angle=5, random_skew=True, output_mask=1)
+        image, mask = FakeTextDataGenerator.generate_from_config(
+            0, "TEST TEST TEST", "tests/font.ttf", config, seed=3
+        )
+        fast_image, fast_mask = FakeTextDataGenerator.generate_from_config(
+            0,
+            "TEST TEST TEST",
+            "tests/font.ttf",
+            config.replace(fast_transform=True),
+            seed=3,
+        )
+        self.assertEqual(fast_image.size, image.size)
+        self.assertEqual(fast_mask.size, mask.size)
+
+    def test_stage_timings(self):
+        timer = StageTimer()
+        FakeTextDataGenerator.generate_from_config(
+            0,
+            "TEST TEST TEST",
+            "tests/font.ttf",
+            GenerationConfig(out_dir="tests/out/", name_format=2),
+            timer=timer,
+        )
+        self.assertEqual(
+            list(timer.durations),
+            [
+                "render",
+                "rotate",
+                "distort",
+                "resize",
+                "background",
+                "contrast",
+                "composite",
+                "blur",
+                "encode",
+                "write",
+            ],
+        )
+        os.remove("tests/out/0.jpg")
+
+        timings = StageTimings()
+        for ms in range(1, 101):
+            timings.add({"render": ms / 1000, "blur": 0.001})
+        summary = timings.summary()
+        self.assertEqual(list(summary), ["render", "blur"])
+        self.assertEqual(summary["render"]["count"], 100)
+        self.assertAlmostEqual(summary["render"]["total"], 5.05)
+        # Within the resolution of the buckets
+        self.assertAlmostEqual(summary["render"]["p50"], 0.050, delta=0.005)
+        self.assertAlmostEqual(summary["render"]["p95"], 0.095, delta=0.01)
+        self.assertAlmostEqual(summary["blur"]["p95"], 0.001, delta=0.0002)
+        self.assertIn("render", format_timings(timings))
+
+    def test_benchmark_stages(self):
+        results = run_stages(["TEST", "TEST TEST"], ["tests/font.ttf"], 32)
+        self.assertIn("text", results)
+        self.assertIn("background.quasicrystal", results)
+        self.assertIn("distorsion.random", results)
+        self.assertIn("mask_to_bboxes", results)
+        self.assertIn("generate", results)
+        self.assertTrue(all(v > 0 for v in results.values()))
+
+        record = {"language": "latin", "length": 1, "height": 32, "stage": "text"}
+        self.assertIn(
+            "2.00x",
+            compare_matrix(
+                [dict(record, images_per_second=50.0)],
+                [dict(record, images_per_second=100.0)],
+            ),
+        )
+
+    def test_profile_workers(self):
+        profile_dir = "tests/out/profile"
+        prepare_profile_dir(profile_dir)
+        pool = multiprocessing.Pool(
+            2, initializer=start_worker_profile, initargs=(profile_dir,)
+        )
+        self.assertEqual(pool.starmap(shard_range, [(10, 0, 2)] * 4)[0], (0, 5))
+        pool.close()
+        pool.join()
+
+        self.assertEqual(
+            len([f for f in os.listdir(profile_dir) if f.startswith("worker-")]), 2
+        )
+        report = io.StringIO()
+        merge_profiles(profile_dir, limit=None, stream=report)
+        self.assertIn("shard_range", report.getvalue())
+        self.assertTrue(os.path.exists(os.path.join(profile_dir, "merged.pstats")))
+        shutil.rmtree(profile_dir)
+
+    def test_font_cache(self):
+        computer_text_generator.load_font.cache_clear()
+        computer_text_generator.glyph_metrics.cache_clear()
+        for _ in range(3):
+            computer_text_generator.generate(
+                "TEST", "tests/font.ttf", "#000000", 32, 0, 1, 0, False, False
+            )
+        info = computer_text_generator.glyph_metrics.cache_info()
+        self.assertEqual((info.hits, info.misses), (2, 1))
+        self.assertEqual(computer_text_generator.load_font.cache_info().misses, 1)
+        self.assertIs(
+            computer_text_generator.load_font("tests/font.ttf", 32),
+            computer_text_generator.load_font("tests/font.ttf", 32),
+        )
+
+    def test_glyph_metrics(self):
+        metrics = computer_text_generator.glyph_metrics("tests/font.ttf", 32)
+        metrics.preload("ABC")
+        self.assertTrue({"A", "B", "C"} <= set(metrics.advances))
+        self.assertTrue({"A", "B", "C"} <= set(metrics.heights))
+        self.assertEqual(
+            metrics.advance("A"), round(metrics.image_font.getlength("A"))
+        )
+        # Words are measured as a whole, and not cached
+        self.assertEqual(
+            metrics.advance("AB"), round(metrics.image_font.getlength("AB"))
+        )
+        self.assertNotIn("AB", metrics.advances)
+        # Thai marks take no width
+        self.assertEqual(metrics.advance("\u0e48"), 0)
+        self.assertEqual(metrics.advance("\u0e3a"), 0)
+
+    def test_generate_whole_line(self):
+        image_font = computer_text_generator.load_font("tests/font.ttf", 32)
+        args = ("AVA Wolf", "tests/font.ttf", "#000000", 32, 0, 1, 0, False, False)
+        image, mask = computer_text_generator.generate(
+            *args, with_mask=False, whole_line=True
+        )
+        self.assertIsNone(mask)
+        # Drawn at once, with the kerning of the font
+        expected = Image.new("RGBA", image.size, (0, 0, 0, 0))
+        ImageDraw.Draw(expected).text(
+            (0, 0), "AVA Wolf", fill=(0, 0, 0), font=image_font
+        )
+        self.assertTrue(np.array_equal(np.asarray(image), np.asarray(expected)))
+        # A line drawn at once has no character mask
+        with self.assertRaises(ValueError):
+            computer_text_generator.generate(*args, whole_line=True)
+        with self.assertRaises(ValueError):
+            GenerationConfig(whole_line=True, output_bboxes=1)
+
+        # The line is as wide as the font measures it, the glyphs that
+        # overhang their advance are not cut
+        text = "AVAWAY To fi ff"
+        args = (text, "tests/font.ttf", "#000000", 32, 0, 1, 0, False, False)
+        image, _ = computer_text_generator.generate(
+            *args, with_mask=False, whole_line=True
+        )
+        self.assertEqual(image.size[0], image_font.getbbox(text)[2])
+        self.assertGreater(
+            image.size[0], computer_text_generator.generate(*args)[0].size[0]
+        )
+        image, _ = computer_text_generator.generate(
+            *args, stroke_width=2, with_mask=False, whole_line=True
+        )
+        left, _, right, _ = image_font.getbbox(text, stroke_width=2)
+        self.assertEqual(image.size[0], right - left)
+
+        # Right-to-left text is already in display order, it is still drawn
+        # character by character
+        args = (
+            get_display("اختبار"),
+            "trdg/fonts/ar/NotoSansArabic-Regular.ttf",
+            "#000000",
+            32,
+            0,
+            1,
+            0,
+            False,
+            False,
+        )
+        image, _ = computer_text_generator.generate(
+            *args, with_mask=False, whole_line=True
+        )
+        drawn, _ = computer_text_generator.generate(*args, with_mask=False)
+        self.assertTrue(np.array_equal(np.asarray(image), np.asarray(drawn)))
+
+    def test_generate_data_same_image_with_metadata(self):
+        # The metadata needs the character mask, which must not change the
+        # pixels of the sample
+        for config in (GenerationConfig(), GenerationConfig(whole_line=True)):
+            metadata = {}
+            images = [
+                FakeTextDataGenerator.generate_from_config(
+                    3, "AVA Wolf", "tests/font.ttf", config, seed=7, metadata=m
+                )
+                for m in (None, metadata)
+            ]
+            self.assertTrue(
+                np.array_equal(np.asarray(images[0]), np.asarray(images[1]))
+            )
+            self.assertEqual("bboxes" in metadata, not config.whole_line)
+
+    def test_layout_text(self):
+        metrics = computer_text_generator.glyph_metrics("tests/font.ttf", 32)
+        pieces, positions, size = computer_text_generator.layout_text(
+            "AB C\nD", metrics, 10, 2
+        )
+        self.assertEqual(pieces, ["A", "B", " ", "C", "\n", "D"])
+        a, b = metrics.advance("A"), metrics.advance("B")
+        self.assertEqual(
+            positions[:4], [(0, 0), (a + 2, 0), (a + b + 4, 0), (a + b + 16, 0)]
+        )
+        line_height = max(metrics.height(c) for c in "ABC D")
+        self.assertEqual(positions[5], (0, line_height))
+        self.assertEqual(size, (a + b + 16 + metrics.advance("C"), 2 * line_height))
+
+    def test_wrap_text(self):
+        text = "Lorem ipsum dolor sit amet consectetur"
+        wrapped = computer_text_generator.wrap_text(text, "tests/font.ttf", 32, 200)
+        self.assertEqual(len(wrapped), len(text))
+        self.assertEqual(wrapped.replace("\n", " "), text)
+        image_font = computer_text_generator.load_font("tests/font.ttf", 32)
+        lines = wrapped.split("\n")
+        self.assertGreater(len(lines), 1)
+        for line in lines:
+            self.assertLessEqual(image_font.getlength(line), 200)
+        # A word wider than the line is kept whole
+        self.assertEqual(
+            computer_text_generator.wrap_text(
+                "a consectetur b", "tests/font.ttf", 32, 20
+            ),
+            "a\nconsectetur\nb",
+        )
+
+    def test_generate_data_with_wrap(self):
+        text = "Lorem ipsum dolor sit amet consectetur adipiscing elit"
+        config = GenerationConfig(
+            width=200, wrap=True, output_mask=1, background_type=1
+        )
+        image, mask = FakeTextDataGenerator.generate_from_config(
+            0, text, "tests/font.ttf", config, seed=0
+        )
+        self.assertEqual(image.size[0], 200)
+        self.assertGreater(image.size[1], 2 * 32 - 10)
+        self.assertEqual(mask.size, image.size)
+        # The characters keep their index in the text
+        self.assertEqual(int(mask_to_label_map(mask).max()), len(text))
+
+    def test_glyph_atlas(self):
+        atlas = computer_text_generator.glyph_atlas("tests/font.ttf", 32)
+        self.assertIs(atlas, computer_text_generator.glyph_atlas("tests/font.ttf", 32))
+        atlas.preload("AB")
+        self.assertEqual(set(atlas.glyphs), {"A", "B"})
+        left, top, fill, stroke, label = atlas.glyph("A")
+        self.assertIsNone(stroke)
+        self.assertEqual(fill.shape, label.shape)
+        self.assertTrue(0 < fill.max() <= 1)
+        # Spaces have an empty bitmap
+        self.assertEqual(atlas.glyph(" ")[2].size, 0)
+
+    def test_generate_with_glyph_atlas(self):
+        for stroke_width in (0, 2):
+            args = ("Test atlas", "tests/font.ttf", "#282828", 32, 0, 1, 1, False)
+            drawn, drawn_mask = computer_text_generator.generate(
+                *args, False, stroke_width, "#282828"
+            )
+            blitted, blitted_mask = computer_text_generator.generate(
+                *args, False, stroke_width, "#282828", atlas=True
+            )
+            self.assertEqual(drawn.size, blitted.size)
+            drawn_arr = np.asarray(drawn, dtype=int)
+            blitted_arr = np.asarray(blitted, dtype=int)
+            self.assertLessEqual(np.abs(drawn_arr - blitted_arr)[..., 3].max(), 1)
+            visible = drawn_arr[..., 3] > 0
+            self.assertTrue(
+                np.array_equal(drawn_arr[visible, :3], blitted_arr[visible, :3])
+            )
+            # Every character is labelled in the mask, stroke included
+            self.assertEqual(
+                set(np.unique(mask_to_label_map(blitted_mask))), set(range(11)) - {5}
+            )
+            if stroke_width == 0:
+                self.assertTrue(
+                    np.array_equal(np.asarray(drawn_mask), np.asarray(blitted_mask))
+                )
+
+    def test_label_map_to_mask(self):
+        label_map = np.array([[0, 1], [254, 300]], dtype=np.uint16)
+        mask = label_map_to_mask(label_map)
+        self.assertEqual(mask.mode, "RGB")
+        self.assertEqual(mask.getpixel((1, 1)), (0, 1, 45))
+        self.assertTrue(np.array_equal(mask_to_label_map(mask), label_map))
+
+    def test_label_map_to_bboxes(self):
+        for text, word_split in (("Test boxes", False), ("Test  word boxes", True)):
+            _, mask = computer_text_generator.generate(
+                text, "tests/font.ttf", "#282828", 32, 0, 1, 0, False, word_split
+            )
+            label_map = mask_to_label_map(mask)
+            for tess in (False, True):
+                self.assertEqual(
+                    label_map_to_bboxes(label_map, tess=tess),
+                    mask_to_bboxes(mask, tess=tess),
+                )
+        self.assertEqual(label_map_to_bboxes(np.zeros((4, 4), dtype=np.uint16)), [])
+
+    def test_generate_label_map(self):
+        for atlas in (False, True):
+            args = ("Test label", "tests/font.ttf", "#282828", 32, 0, 1, 1, False)
+            _, mask = computer_text_generator.generate(*args, False, atlas=atlas)
+            _, label_map = computer_text_generator.generate(
+                *args, False, atlas=atlas, label_map=True
+            )
+            self.assertEqual(label_map.mode, "I;16")
+            self.assertTrue(
+                np.array_equal(np.asarray(label_map), mask_to_label_map(mask))
+            )
+
+    def test_generate_data_with_label_map(self):
+        config = GenerationConfig(
+            output_mask=1, mask_type=1, distorsion_type=1, background_type=1
+        )
+        image, mask = FakeTextDataGenerator.generate_from_config(
+            0, "Test label", "tests/font.ttf", config, seed=0
+        )
+        self.assertEqual(mask.mode, "I;16")
+        self.assertEqual(mask.size, image.size)
+        self.assertEqual(set(np.unique(np.asarray(mask))), set(range(11)) - {5})
+        _, mask_arr = FakeTextDataGenerator.generate_from_config(
+            0, "Test label", "tests/font.ttf", config, seed=0, output="numpy"
+        )
+        self.assertEqual(mask_arr.dtype, np.uint16)
+        self.assertTrue(np.array_equal(mask_arr, np.asarray(mask)))
+        with self.assertRaises(ValueError):
+            GenerationConfig(mask_type=3)
+
+    def test_encode_files_label_map(self):
+        label_map = Image.fromarray(np.array([[0, 1], [2, 300]], dtype=np.uint16))
+        image = Image.new("RGB", (2, 2))
+        files = dict(
+            FakeTextDataGenerator.encode_files(
+                "a", "png", "ab", image, label_map, 1, 0, mask_type=2
+            )
+        )
+        self.assertEqual(
+            np.load(io.BytesIO(files["a_mask.npy"])).tolist(), [[0, 1], [2, 300]]
+        )
+        files = dict(
+            FakeTextDataGenerator.encode_files(
+                "a", "png", "ab", image, label_map, 1, 1, mask_type=1
+            )
+        )
+        reopened = Image.open(io.BytesIO(files["a_mask.png"]))
+        self.assertIn(reopened.mode, ("I;16", "I"))
+        self.assertEqual(np.asarray(reopened).tolist(), [[0, 1], [2, 300]])
+        self.assertIn("a_boxes.txt", files)
+
+    def test_benchmark(self):
+        results = run_benchmark(
+            {"no mask": {}, "mask": {"output_mask": 1}},
+            ["TEST", "TEST TEST"],
+            ["tests/font.ttf"],
+        )
+        self.assertEqual(list(results), ["no mask", "mask"])
+        self.assertTrue(all(v > 0 for v in results.values()))
+        self.assertIn("1.00x", format_results(results))
+
+    def test_generate_data_with_metadata(self):
+        metadata = {}
+        FakeTextDataGenerator.generate(
+            0,
+            "TEST",
+            "tests/font.ttf",
+            None,
+            32,
+            None,
+            5,
+            True,
+            2,
+            False,
+            1,
+            0,
+            0,
+            False,
+            0,
+            -1,
+            0,
+            "#010101",
+            0,
+            1,
+            0,
+            (5, 5, 5, 5),
+            0,
+            0,
+            False,
+            "",
+            seed=7,
+            metadata=metadata,
+        )
+        self.assertEqual(
+            sorted(metadata), ["background", "bboxes", "blur", "font", "size", "skew"]
+        )
+        self.assertEqual(metadata["font"], "tests/font.ttf")
+        self.assertEqual(metadata["size"][1], 32)
+        self.assertTrue(-5 <= metadata["skew"] <= 5)
+        self.assertEqual(metadata["blur"], 2)
+        self.assertEqual(metadata["background"], 1)
+        self.assertEqual(len(metadata["bboxes"]), 4)
+
+    def test_tar_shard_writer(self):
+        os.mkdir("tests/out/tar")
+        writer = TarShardWriter("tests/out/tar", 2)
+        for i in range(5):
+            writer.write(
+                [
+                    ("label {}_{}.jpg".format(i, i), b"image"),
+                    ("label {}_{}_mask.png".format(i, i), b"mask"),
+                ],
+                {"index": i, "file": "label {}_{}.jpg".format(i, i), "label": "l"},
+            )
+        writer.close()
+
+        self.assertEqual(
+            sorted(os.listdir("tests/out/tar")),
+            ["samples-000000.tar", "samples-000001.tar", "samples-000002.tar"],
+        )
+        with tarfile.open("tests/out/tar/samples-000000.tar") as tar:
+            self.assertEqual(
+                tar.getnames(),
+                [
+                    "000000000.jpg",
+                    "000000000.mask.png",
+                    "000000000.txt",
+                    "000000001.jpg",
+                    "000000001.mask.png",
+                    "000000001.txt",
+                ],
+            )
+            self.assertEqual(tar.extractfile("000000001.txt").read(), b"l")
+
+        empty_directory("tests/out/tar")
+        os.rmdir("tests/out/tar")
+
+    def test_pack(self):
+        os.mkdir("tests/out/pack")
+        writer = PackWriter("tests/out/pack/samples.pack")
+        for i in [3, 0, 2]:
+            writer.write(
+                [("{}.jpg".format(i), "image {}".format(i).encode("utf8"))],
+                {"index": i, "file": "{}.jpg".format(i), "label": "label {}".format(i)},
+            )
+        writer.close()
+
+        with PackReader("tests/out/pack/samples.pack") as reader:
+            self.assertEqual(len(reader), 3)
+            self.assertEqual([reader.sample_index(i) for i in range(3)], [0, 2, 3])
+            self.assertEqual(reader[2], {"jpg": b"image 3", "txt": b"label 3"})
+            self.assertEqual(reader.label(reader.find(2)), "label 2")
+            self.assertRaises(KeyError, reader.find, 1)
+            self.assertRaises(IndexError, reader.__getitem__, 3)
+        self.assertFalse(os.path.exists("tests/out/pack/samples.entries"))
+
+        # The index of a killed run is written from the streamed entries,
+        # without the sample that was cut
+        writer = PackWriter("tests/out/pack/samples.pack")
+        for i in [1, 0]:
+            writer.write(
+                [("{}.jpg".format(i), "image {}".format(i).encode("utf8"))],
+                {"index": i, "file": "{}.jpg".format(i), "label": "label {}".format(i)},
+            )
+        writer.file.flush()
+        writer.entries_file.write(INDEX_ENTRY.pack(2, writer.offset, 100))
+        writer.entries_file.flush()
+        self.assertEqual(write_index("tests/out/pack/samples.pack"), 2)
+        with PackReader("tests/out/pack/samples.pack") as reader:
+            self.assertEqual(reader.label(1), "label 1")
+        writer.file.close()
+        writer.entries_file.close()
+
+        empty_directory("tests/out/pack")
+        os.rmdir("tests/out/pack")
+
+    def test_generate_data_with_return_files(self):
+        name, files = FakeTextDataGenerator.generate(
+            0,
+            "TEST TEST TEST",
+            "tests/font.ttf",
+            "tests/out/",
+            64,
+            "jpg",
+            0,
+            False,
+            0,
+            False,
+            1,
+            0,
+            0,
+            False,
+            0,
+            -1,
+            0,
+            "#010101",
+            0,
+            1,
+            0,
+            (5, 5, 5, 5),
+            0,
+            1,
+            False,
+            "",
+            output_bboxes=1,
+            seed=7,
+            return_files=True,
+        )
+        self.assertEqual(name, "TEST TEST TEST_0.jpg")
+        self.assertEqual(
+            [file_name for file_name, _ in files],
+            [
+                "TEST TEST TEST_0.jpg",
+                "TEST TEST TEST_0_mask.png",
+                "TEST TEST TEST_0_boxes.txt",
+            ],
+        )
+        self.assertFalse(os.path.exists("tests/out/TEST TEST TEST_0.jpg"))
+
+        FakeTextDataGenerator.generate(
+            0,
+            "TEST TEST TEST",
+            "tests/font.ttf",
+            "tests/out/",
+            64,
+            "jpg",
+            0,
+            False,
+            0,
+            False,
+            1,
+            0,
+            0,
+            False,
+            0,
+            -1,
+            0,
+            "#010101",
+            0,
+            1,
+            0,
+            (5, 5, 5, 5),
+            0,
+            1,
+            False,
+            "",
+            output_bboxes=1,
+            seed=7,
+        )
+        for file_name, content in files:
+            with open(os.path.join("tests/out/", file_name), "rb") as f:
+                self.assertEqual(f.read(), content)
+
+        empty_directory("tests/out/")
+
 
 class CommandLineInterface(unittest.TestCase):
     def test_output_dir(self):
@@ -1414,6 +2464,38 @@ class CommandLineInterface(unittest.TestCase):
         self.assertTrue(len(os.listdir("tests/out/")) == 1)
         empty_directory("tests/out/")
 
+    def test_handwritten_with_seed(self):
+        # Forked workers share the global random states, the strokes must
+        # only depend on the seed and index of the sample
+        contents = []
+        for thread_count in ("1", "2"):
+            args = [
+                "python3",
+                "run.py",
+                "-l",
+                "fr",
+                "-c",
+                "2",
+                "-hw",
+                "-t",
+                thread_count,
+                "--seed",
+                "3",
+                "--output_dir",
+                "../tests/out/",
+            ]
+            subprocess.Popen(args, cwd="trdg/").wait()
+            files = sorted(os.listdir("tests/out/"))
+            self.assertEqual(len(files), 2)
+            images = []
+            for f in files:
+                with open(os.path.join("tests/out/", f), "rb") as image:
+                    images.append(image.read())
+            contents.append(images)
+            empty_directory("tests/out/")
+        self.assertEqual(contents[0], contents[1])
+        self.assertNotEqual(contents[0][0], contents[0][1])
+
     def test_personalfont(self):
         args = [
             "python3",
@@ -1519,6 +2601,109 @@ class CommandLineInterface(unittest.TestCase):
         self.assertTrue(len(os.listdir("tests/out/")) == 0)
         empty_directory("tests/out/")
 
+    def test_resume(self):
+        args = [
+            "python3",
+            "run.py",
+            "-l",
+            "fr",
+            "-c",
+            "4",
+            "--seed",
+            "1",
+            "--output_dir",
+            "../tests/out_resume/",
+        ]
+        subprocess.Popen(args, cwd="trdg/").wait()
+        images = sorted(os.listdir("tests/out_resume/"))
+        os.remove(os.path.join("tests/out_resume/", images[0]))
+        subprocess.Popen(args + ["--resume"], cwd="trdg/").wait()
+        self.assertEqual(
+            sorted(os.listdir("tests/out_resume/")), sorted(images + ["manifest.jsonl"])
+        )
+        empty_directory("tests/out_resume/")
+
+    def test_resume_labels(self):
+        args = [
+            "python3",
+            "run.py",
+            "-l",
+            "fr",
+            "-c",
+            "6",
+            "-na",
+            "2",
+            "--seed",
+            "1",
+            "--output_dir",
+            "../tests/out_resume/",
+        ]
+        subprocess.Popen(args, cwd="trdg/").wait()
+        with open("tests/out_resume/labels.txt", "r", encoding="utf8") as f:
+            labels = f.readlines()
+        self.assertEqual(len(labels), 6)
+
+        # Lines lost by the interrupted run are written again
+        with open("tests/out_resume/labels.txt", "w", encoding="utf8") as f:
+            f.writelines(labels[:3])
+        subprocess.Popen(args + ["--resume"], cwd="trdg/").wait()
+        with open("tests/out_resume/labels.txt", "r", encoding="utf8") as f:
+            self.assertEqual(sorted(f.readlines()), sorted(labels))
+
+        # The samples generated again are listed once
+        os.remove("tests/out_resume/manifest.jsonl")
+        os.remove("tests/out_resume/0.jpg")
+        os.remove("tests/out_resume/4.jpg")
+        subprocess.Popen(args + ["--resume"], cwd="trdg/").wait()
+        with open("tests/out_resume/labels.txt", "r", encoding="utf8") as f:
+            self.assertEqual(sorted(f.readlines()), sorted(labels))
+        self.assertTrue(os.path.exists("tests/out_resume/4.jpg"))
+        empty_directory("tests/out_resume/")
+
+    def test_resume_files(self):
+        args = [
+            "python3",
+            "run.py",
+            "-l",
+            "fr",
+            "-c",
+            "4",
+            "-na",
+            "2",
+            "-om",
+            "1",
+            "--seed",
+            "1",
+            "--output_dir",
+            "../tests/out_resume/",
+        ]
+        subprocess.Popen(args, cwd="trdg/").wait()
+        files = sorted(os.listdir("tests/out_resume/"))
+
+        # A sample is only complete with all its files
+        os.remove("tests/out_resume/2_mask.png")
+        subprocess.Popen(args + ["--resume"], cwd="trdg/").wait()
+        self.assertEqual(
+            sorted(os.listdir("tests/out_resume/")), sorted(files + ["manifest.jsonl"])
+        )
+        self.assertEqual(
+            sorted(
+                r["index"] for r in read_manifest("tests/out_resume/manifest.jsonl")
+            ),
+            [0, 1, 2, 3],
+        )
+
+        # The samples found on disk have no metadata, they are generated again
+        os.remove("tests/out_resume/manifest.jsonl")
+        subprocess.Popen(args + ["--resume", "--manifest"], cwd="trdg/").wait()
+        records = list(read_manifest("tests/out_resume/manifest.jsonl"))
+        self.assertEqual(len(records), 4)
+        self.assertTrue(all("bboxes" in r for r in records))
+
+        # Wikipedia strings cannot be drawn again
+        self.assertNotEqual(subprocess.call(args + ["--resume", "-wk"], cwd="trdg/"), 0)
+        empty_directory("tests/out_resume/")
+
 
 #    def test_word_count(self):
 #        args = ['python3', 'run.py', '-c', '1', '-w', '5']
@@ -1,22 +1,30 @@
 import cv2
+import functools
 import math
 import os
 import random as rnd
 import numpy as np
+from typing import List
 
 from PIL import Image, ImageDraw, ImageFilter
 
+# Maximum number of decoded background images kept in memory per process
+IMAGE_CACHE_SIZE = 64
 
-def gaussian_noise(height: int, width: int) -> Image:
+# Maximum number of image directories whose listing is kept
+IMAGE_DIR_CACHE_SIZE = 8
+
+
+def gaussian_noise(height: int, width: int, rng: rnd.Random = None) -> Image:
     """
     Create a background with Gaussian noise (to mimic paper)
     """
 
-    # We create an all white image
-    image = np.ones((height, width)) * 255
+    if rng is None:
+        rng = rnd
 
-    # We add gaussian noise
-    cv2.randn(image, 235, 10)
+    # We create an image filled with gaussian noise
+    image = np.random.default_rng(rng.getrandbits(32)).normal(235, 10, (height, width))
 
     return Image.fromarray(image).convert("RGBA")
 
@@ -29,17 +37,20 @@ def plain_white(height: int, width: int) -> Image:
     return Image.new("L", (width, height), 255).convert("RGBA")
 
 
-def quasicrystal(height: int, width: int) -> Image:
+def quasicrystal(height: int, width: int, rng: rnd.Random = None) -> Image:
     """
     Create a background with quasicrystal (https://en.wikipedia.org/wiki/Quasicrystal)
     """
 
+    if rng is None:
+        rng = rnd
+
     image = Image.new("L", (width, height))
     pixels = image.load()
 
-    frequency = rnd.random() * 30 + 20  # frequency
-    phase = rnd.random() * 2 * math.pi  # phase
-    rotation_count = rnd.randint(10, 20)  # of rotations
+    frequency = rng.random() * 30 + 20  # frequency
+    phase = rng.random() * 2 * math.pi  # phase
+    rotation_count = rng.randint(10, 20)  # of rotations
 
     for kw in range(width):
         y = float(kw) / (width - 1) * 4 * math.pi - 2 * math.pi
@@ -55,15 +66,18 @@ def quasicrystal(height: int, width: int) -> Image:
     return image.convert("RGBA")
 
 
-def image(height: int, width: int, image_dir: str) -> Image:
+def image(height: int, width: int, image_dir: str, rng: rnd.Random = None) -> Image:
     """
     Create a background with a image
     """
-    images = os.listdir(image_dir)
+    if rng is None:
+        rng = rnd
+
+    images = _list_images(image_dir)
 
     if len(images) > 0:
-        pic = Image.open(
-            os.path.join(image_dir, images[rnd.randint(0, len(images) - 1)])
+        pic = _load_image(
+            os.path.join(image_dir, images[rng.randint(0, len(images) - 1)])
         )
 
         if pic.size[0] < width:
@@ -80,12 +94,46 @@ def image(height: int, width: int, image_dir: str) -> Image:
         if pic.size[0] == width:
             x = 0
         else:
-            x = rnd.randint(0, pic.size[0] - width)
+            x = rng.randint(0, pic.size[0] - width)
         if pic.size[1] == height:
             y = 0
         else:
-            y = rnd.randint(0, pic.size[1] - height)
+            y = rng.randint(0, pic.size[1] - height)
 
         return pic.crop((x, y, x + width, y + height))
     else:
         raise Exception("No images where found in the images folder!")
+
+
+def preload_images(image_dir: str) -> None:
+    """
+    List the background images of image_dir again and decode the first
+    IMAGE_CACHE_SIZE of them, as many as the cache holds, so that the
+    following calls to image() are served from memory
+    """
+
+    clear_image_cache()
+    for pic in _list_images(image_dir)[:IMAGE_CACHE_SIZE]:
+        _load_image(os.path.join(image_dir, pic))
+
+
+def clear_image_cache() -> None:
+    """
+    Forget the listed and decoded background images, e.g. after the content
+    of the image directory changed
+    """
+
+    _list_images.cache_clear()
+    _load_image.cache_clear()
+
+
+@functools.lru_cache(maxsize=IMAGE_DIR_CACHE_SIZE)
+def _list_images(image_dir: str) -> List[str]:
+    return sorted(os.listdir(image_dir))
+
+
+@functools.lru_cache(maxsize=IMAGE_CACHE_SIZE)
+def _load_image(path: str) -> Image:
+    pic = Image.open(path)
+    pic.load()
+    return pic
@@ -0,0 +1,383 @@
+"""
+Benchmark of the sample generation, run with python -m trdg.benchmark
+"""
+
+import argparse
+import datetime
+import json
+import os
+import random as rnd
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Sequence
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from trdg import computer_text_generator
+from trdg.config import GenerationConfig
+from trdg.data_generator import FakeTextDataGenerator
+from trdg.string_generator import create_strings_from_dict
+from trdg.utils import (
+    label_map_to_bboxes,
+    load_dict,
+    load_fonts,
+    mask_to_bboxes,
+    mask_to_label_map,
+)
+
+FONTS_DIR = os.path.join(os.path.dirname(__file__), "fonts")
+DICTS_DIR = os.path.join(os.path.dirname(__file__), "dicts")
+
+# Name and GenerationConfig arguments of the measured cases
+BENCHMARK_CASES = {
+    "no mask": {},
+    "whole line": {"whole_line": True},
+    "mask": {"output_mask": 1},
+    "bboxes": {"output_bboxes": 1},
+    "mask, label map": {"output_mask": 1, "mask_type": 1},
+    "fast transform": {"fast_transform": True},
+    "glyph atlas": {"glyph_atlas": True},
+    "mask, glyph atlas": {"output_mask": 1, "glyph_atlas": True},
+    "skew": {"skewing_angle": 5, "random_skew": True},
+    "skew, fast transform": {
+        "skewing_angle": 5,
+        "random_skew": True,
+        "fast_transform": True,
+    },
+}
+
+
+# Matrix of the stage benchmark: name of the languages and the code of their
+# dictionary and fonts, number of words per string and image heights
+MATRIX_LANGUAGES = {"latin": "fr", "cn": "cn", "ar": "ar", "th": "th"}
+MATRIX_LENGTHS = (1, 3, 10)
+MATRIX_HEIGHTS = (32, 64)
+
+# Stages measured on their own, by GenerationConfig type
+BACKGROUND_TYPES = {
+    "gaussian_noise": 0,
+    "plain_white": 1,
+    "quasicrystal": 2,
+    "image": 3,
+}
+DISTORSION_TYPES = {"sin": 1, "cos": 2, "random": 3}
+
+
+def warm_up(
+    config: GenerationConfig, strings: List[str], fonts: List[str], seed: int = 0
+) -> None:
+    """
+    Generate one sample per string without timing it, so that the fonts,
+    glyph metrics and atlases they need are cached before they are measured,
+    as they are in the workers of a run
+    """
+
+    for i, text in enumerate(strings):
+        FakeTextDataGenerator.generate_from_config(
+            i, text, fonts[i % len(fonts)], config, seed=seed + i
+        )
+
+
+def run_case(
+    config: GenerationConfig,
+    strings: List[str],
+    fonts: List[str],
+    seed: int = 0,
+    warm: bool = True,
+) -> float:
+    """
+    Generate one sample per string and return the number of samples per
+    second. With warm, the samples are generated once before being timed, so
+    that no case pays for the caches filled by another.
+    """
+
+    if warm:
+        warm_up(config, strings, fonts, seed)
+    start = time.perf_counter()
+    for i, text in enumerate(strings):
+        FakeTextDataGenerator.generate_from_config(
+            i, text, fonts[i % len(fonts)], config, seed=seed + i
+        )
+    return len(strings) / (time.perf_counter() - start)
+
+
+def run_benchmark(
+    cases: Dict[str, dict], strings: List[str], fonts: List[str]
+) -> Dict[str, float]:
+    return {
+        name: run_case(GenerationConfig(**kwargs), strings, fonts)
+        for name, kwargs in cases.items()
+    }
+
+
+def run_stages(
+    strings: List[str], fonts: List[str], height: int, seed: int = 0
+) -> Dict[str, float]:
+    """
+    Images per second of every stage of the pipeline on its own, then of the
+    whole generate, for one image per string
+    """
+
+    rng = rnd.Random(seed)
+    config = GenerationConfig(size=height)
+    results = {}
+    warm_up(config, strings, fonts, seed)
+
+    rendered = []
+    start = time.perf_counter()
+    for i, text in enumerate(strings):
+        rendered.append(
+            computer_text_generator.generate(
+                text,
+                fonts[i % len(fonts)],
+                config.text_colors,
+                height,
+                0,
+                1.0,
+                0,
+                False,
+                False,
+                rng=rng,
+            )
+        )
+    results["text"] = len(strings) / (time.perf_counter() - start)
+    results["text.whole_line"] = _rate(
+        lambda sample: computer_text_generator.generate(
+            sample[0],
+            sample[1],
+            config.text_colors,
+            height,
+            0,
+            1.0,
+            0,
+            False,
+            False,
+            rng=rng,
+            with_mask=False,
+            whole_line=True,
+        ),
+        [(text, fonts[i % len(fonts)]) for i, text in enumerate(strings)],
+    )
+
+    for name, background_type in BACKGROUND_TYPES.items():
+        background = config.replace(background_type=background_type).background
+        results["background." + name] = _rate(
+            lambda sample: background(height, sample[0].size[0], rng=rng), rendered
+        )
+    for name, distorsion_type in DISTORSION_TYPES.items():
+        distort = config.replace(distorsion_type=distorsion_type).distort
+        results["distorsion." + name] = _rate(
+            lambda sample: distort(sample[0], sample[1], rng=rng), rendered
+        )
+    results["mask_to_bboxes"] = _rate(
+        lambda sample: mask_to_bboxes(sample[1]), rendered
+    )
+    results["label_map_to_bboxes"] = _rate(
+        label_map_to_bboxes, [mask_to_label_map(mask) for _, mask in rendered]
+    )
+    results["generate"] = run_case(config, strings, fonts, seed, warm=False)
+    return results
+
+
+def run_matrix(
+    count: int,
+    languages: Sequence[str] = tuple(MATRIX_LANGUAGES),
+    lengths: Sequence[int] = MATRIX_LENGTHS,
+    heights: Sequence[int] = MATRIX_HEIGHTS,
+    seed: int = 0,
+) -> List[dict]:
+    """
+    run_stages for every language, text length and height of the matrix.
+    Returns one record per measure. A language without fonts is skipped.
+    """
+
+    results = []
+    for language in languages:
+        code = MATRIX_LANGUAGES.get(language, language)
+        if language != "latin" and not os.path.isdir(os.path.join(FONTS_DIR, code)):
+            print("Skipping {}, there are no {} fonts".format(language, code))
+            continue
+        fonts = load_fonts(code)
+        lang_dict = load_dict(os.path.join(DICTS_DIR, code + ".txt"))
+        for length in lengths:
+            strings = create_strings_from_dict(
+                length, False, count, lang_dict, rnd.Random(seed)
+            )
+            for height in heights:
+                for stage, images_per_second in run_stages(
+                    strings, fonts, height, seed
+                ).items():
+                    results.append(
+                        {
+                            "language": language,
+                            "length": length,
+                            "height": height,
+                            "stage": stage,
+                            "images_per_second": images_per_second,
+                        }
+                    )
+    return results
+
+
+def write_matrix(path: str, results: List[dict], count: int) -> None:
+    """
+    Save the results of run_matrix with what is needed to compare them with
+    another commit
+    """
+
+    with open(path, "w", encoding="utf8") as f:
+        json.dump(
+            {
+                "commit": _git_commit(),
+                "date": datetime.datetime.now().isoformat(timespec="seconds"),
+                "count": count,
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+
+
+def compare_matrix(baseline: List[dict], results: List[dict]) -> str:
+    """
+    Speedup of every measure of results over the same measure of baseline
+    """
+
+    def key(record):
+        return record["language"], record["length"], record["height"], record["stage"]
+
+    before = {key(record): record["images_per_second"] for record in baseline}
+    lines = []
+    for record in results:
+        if key(record) in before:
+            lines.append(
+                "{:<8}{:>4} words{:>5}px  {:<28}{:5.2f}x".format(
+                    *key(record), record["images_per_second"] / before[key(record)]
+                )
+            )
+    return "\n".join(lines)
+
+
+def format_matrix(results: List[dict]) -> str:
+    return "\n".join(
+        "{:<8}{:>4} words{:>5}px  {:<28}{:10.1f} images/s".format(
+            record["language"],
+            record["length"],
+            record["height"],
+            record["stage"],
+            record["images_per_second"],
+        )
+        for record in results
+    )
+
+
+def format_results(results: Dict[str, float]) -> str:
+    baseline = next(iter(results.values()))
+    width = max(len(name) for name in results)
+    return "\n".join(
+        "{}  {:8.1f} samples/s  {:5.2f}x".format(
+            name.ljust(width), samples_per_second, samples_per_second / baseline
+        )
+        for name, samples_per_second in results.items()
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure how many samples per second are generated"
+    )
+    parser.add_argument(
+        "-c",
+        "--count",
+        type=int,
+        nargs="?",
+        help="The number of samples generated for each case",
+        default=500,
+    )
+    parser.add_argument(
+        "-l",
+        "--language",
+        type=str,
+        nargs="?",
+        help="The language of the dictionary and fonts",
+        default="fr",
+    )
+    parser.add_argument(
+        "-w",
+        "--length",
+        type=int,
+        nargs="?",
+        help="Define how many words should be included in each generated sample",
+        default=1,
+    )
+    parser.add_argument(
+        "-m",
+        "--matrix",
+        action="store_true",
+        help="Time every stage of the pipeline on its own (text rendering, backgrounds, distorsions, mask_to_bboxes, label_map_to_bboxes) and the whole generate, for every language, text length and height of the matrix, with --count images each",
+        default=False,
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        nargs="?",
+        help="Write the results of --matrix to this JSON file",
+        default=None,
+    )
+    parser.add_argument(
+        "-cmp",
+        "--compare",
+        type=str,
+        nargs="?",
+        help="JSON file written by an earlier --matrix run, e.g. on another commit, to print the speedup of every measure over",
+        default=None,
+    )
+    args = parser.parse_args()
+
+    if args.matrix:
+        results = run_matrix(args.count)
+        print(format_matrix(results))
+        if args.output is not None:
+            write_matrix(args.output, results, args.count)
+        if args.compare is not None:
+            with open(args.compare, "r", encoding="utf8") as f:
+                print(compare_matrix(json.load(f)["results"], results))
+        return
+
+    lang_dict = load_dict(
+        os.path.join(os.path.dirname(__file__), "dicts", args.language + ".txt")
+    )
+    strings = create_strings_from_dict(args.length, False, args.count, lang_dict)
+    fonts = load_fonts(args.language)
+
+    print(format_results(run_benchmark(BENCHMARK_CASES, strings, fonts)))
+
+
+def _rate(function: Callable, samples: list) -> float:
+    # The first call fills the caches of the stage, e.g. the background images
+    function(samples[0])
+    start = time.perf_counter()
+    for sample in samples:
+        function(sample)
+    return len(samples) / (time.perf_counter() - start)
+
+
+def _git_commit() -> str:
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "HEAD"],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                stderr=subprocess.DEVNULL,
+            )
+            .decode("utf8")
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,12 @@
 import random as rnd
-from typing import Tuple
+import unicodedata
+from functools import lru_cache
+from typing import Iterable, List, Tuple, Union
+
+import numpy as np
 from PIL import Image, ImageColor, ImageDraw, ImageFilter, ImageFont
 
-from trdg.utils import get_text_width, get_text_height
+from trdg.utils import get_text_width, get_text_height, label_map_to_mask
 
 # Thai Unicode reference: https://jrgraphix.net/r/Unicode/0E00-0E7F
 TH_TONE_MARKS = [
@@ -15,14 +19,201 @@ TH_TONE_MARKS = [
     "0xe4d",
     "0xe4e",
 ]
-TH_UNDER_VOWELS = ["0xe38", "0xe39", "\0xe3A"]
+TH_UNDER_VOWELS = ["0xe38", "0xe39", "0xe3a"]
 TH_UPPER_VOWELS = ["0xe31", "0xe34", "0xe35", "0xe36", "0xe37"]
 
+# Code points of the Thai marks drawn over or under the previous character,
+# they take no width
+TH_ZERO_WIDTH = frozenset(
+    int(c, 16) for c in TH_TONE_MARKS + TH_UNDER_VOWELS + TH_UPPER_VOWELS
+)
+
+
+# Number of (font, size) pairs kept loaded by load_font, glyph_metrics and
+# glyph_atlas
+FONT_CACHE_SIZE = 256
+
+# (first, last) colors of a color range such as "#000000,#888888"
+ColorRange = Tuple[Tuple[int, ...], Tuple[int, ...]]
+
+
+def parse_color_range(colors: str) -> ColorRange:
+    """
+    Parse a single color or a "first,last" range of colors
+    """
+
+    parsed = [ImageColor.getrgb(c) for c in colors.split(",")]
+    return parsed[0], parsed[-1]
+
+
+@lru_cache(maxsize=FONT_CACHE_SIZE)
+def load_font(font: str, font_size: int) -> ImageFont.FreeTypeFont:
+    """
+    Same as ImageFont.truetype, but the fonts stay loaded in the process:
+    parsing the font file for every sample is expensive, CJK fonts are
+    several MB. load_font.cache_info() gives the hits and misses.
+    """
+
+    return ImageFont.truetype(font=font, size=font_size)
+
+
+class GlyphMetrics(object):
+    """
+    Sizes of the characters of a font at a given size, measured once and then
+    looked up. Longer pieces of text (words) are measured every time, so that
+    their kerning is kept.
+
+    - advance: width taken on a horizontal line, 0 for the Thai marks
+    - length: width of the rendered character
+    - height: bottom of the rendered character
+    """
+
+    __slots__ = ("image_font", "advances", "lengths", "heights")
+
+    def __init__(self, image_font: ImageFont.FreeTypeFont):
+        self.image_font = image_font
+        self.advances = {}
+        self.lengths = {}
+        self.heights = {}
+
+    def advance(self, piece: str) -> int:
+        if len(piece) != 1:
+            return _compute_character_width(self.image_font, piece)
+        try:
+            return self.advances[piece]
+        except KeyError:
+            advance = _compute_character_width(self.image_font, piece)
+            self.advances[piece] = advance
+            return advance
+
+    def length(self, piece: str) -> int:
+        if len(piece) != 1:
+            return get_text_width(self.image_font, piece)
+        try:
+            return self.lengths[piece]
+        except KeyError:
+            length = get_text_width(self.image_font, piece)
+            self.lengths[piece] = length
+            return length
+
+    def height(self, piece: str) -> int:
+        if len(piece) != 1:
+            return get_text_height(self.image_font, piece)
+        try:
+            return self.heights[piece]
+        except KeyError:
+            height = get_text_height(self.image_font, piece)
+            self.heights[piece] = height
+            return height
+
+    def preload(self, characters: Iterable[str]) -> None:
+        """
+        Measure the characters in advance, e.g. the alphabet of a dictionary
+        """
+
+        for character in characters:
+            self.advance(character)
+            self.length(character)
+            self.height(character)
+
+
+@lru_cache(maxsize=FONT_CACHE_SIZE)
+def glyph_metrics(font: str, font_size: int) -> GlyphMetrics:
+    """
+    GlyphMetrics of a font at a size, shared by every sample of the process
+    """
+
+    return GlyphMetrics(load_font(font, font_size))
+
+
+class GlyphAtlas(object):
+    """
+    Bitmaps of the characters of a font at a given size and stroke width,
+    rasterized once and then blitted with NumPy instead of being drawn again
+    for every sample. A glyph is a (left, top, fill, stroke, label) tuple:
+
+    - left, top: offset of the bitmaps from the position the glyph is drawn at
+    - fill: alpha of the character, float32 in [0, 1]
+    - stroke: alpha of the character and its stroke, None without stroke
+    - label: pixels of the character in the mask, drawn without antialiasing
+
+    Longer pieces of text (words) are rasterized every time.
+    """
+
+    __slots__ = ("image_font", "stroke_width", "glyphs")
+
+    def __init__(self, image_font: ImageFont.FreeTypeFont, stroke_width: int = 0):
+        self.image_font = image_font
+        self.stroke_width = stroke_width
+        self.glyphs = {}
+
+    def glyph(self, character: str) -> tuple:
+        if len(character) != 1:
+            return self._rasterize(character)
+        try:
+            return self.glyphs[character]
+        except KeyError:
+            glyph = self._rasterize(character)
+            self.glyphs[character] = glyph
+            return glyph
+
+    def preload(self, characters: Iterable[str]) -> None:
+        """
+        Rasterize the characters in advance, e.g. the alphabet of a dictionary
+        """
+
+        for character in characters:
+            self.glyph(character)
+
+    def _rasterize(self, character: str) -> tuple:
+        # The label is drawn without antialiasing, which is hinted differently
+        # and may overflow the bounding box of the antialiased glyph
+        left, top, right, bottom = self.image_font.getbbox(
+            character, stroke_width=self.stroke_width
+        )
+        mono_box = self.image_font.getbbox(
+            character, mode="1", stroke_width=self.stroke_width
+        )
+        left, top = min(left, mono_box[0]), min(top, mono_box[1])
+        right, bottom = max(right, mono_box[2]), max(bottom, mono_box[3])
+        size = (max(right - left, 0), max(bottom - top, 0))
+
+        def draw(stroke_width, fontmode="L"):
+            bitmap = Image.new("L", size, 0)
+            bitmap_draw = ImageDraw.Draw(bitmap)
+            bitmap_draw.fontmode = fontmode
+            bitmap_draw.text(
+                (-left, -top),
+                character,
+                fill=255,
+                font=self.image_font,
+                stroke_width=stroke_width,
+                stroke_fill=255,
+            )
+            return np.asarray(bitmap)
+
+        fill = draw(0).astype(np.float32) / 255
+        stroke = None
+        if self.stroke_width:
+            stroke = draw(self.stroke_width).astype(np.float32) / 255
+        label = draw(self.stroke_width, fontmode="1") > 0
+        return left, top, fill, stroke, label
+
+
+@lru_cache(maxsize=FONT_CACHE_SIZE)
+def glyph_atlas(font: str, font_size: int, stroke_width: int = 0) -> GlyphAtlas:
+    """
+    GlyphAtlas of a font at a size and stroke width, shared by every sample of
+    the process. The glyphs are rasterized the first time they are drawn.
+    """
+
+    return GlyphAtlas(load_font(font, font_size), stroke_width)
+
 
 def generate(
     text: str,
     font: str,
-    text_color: str,
+    text_color: Union[str, ColorRange],
     font_size: int,
     orientation: int,
     space_width: int,
@@ -30,8 +221,35 @@ def generate(
     fit: bool,
     word_split: bool,
     stroke_width: int = 0,
-    stroke_fill: str = "#282828",
+    stroke_fill: Union[str, ColorRange] = "#282828",
+    rng: rnd.Random = None,
+    with_mask: bool = True,
+    atlas: bool = False,
+    label_map: bool = False,
+    whole_line: bool = False,
 ) -> Tuple:
+    """
+    Render the text and its character mask, or None instead of the mask when
+    with_mask is False. The colors can be given already parsed by
+    parse_color_range. With atlas, horizontal text that is not split in words
+    is blitted from the GlyphAtlas of the font instead of being drawn one
+    character at a time. With label_map, the mask is a 16 bit ("I;16") label
+    map where the pixels of the i-th character are i + 1, instead of an RGB
+    image where they are colored ((i + 1) // (255 * 255), (i + 1) // 255,
+    (i + 1) % 255). With whole_line, each line of horizontal text is drawn at
+    once, with the kerning and ligatures of the font, which leaves no
+    character mask to make.
+    """
+
+    if whole_line and with_mask:
+        raise ValueError("A line drawn at once has no character mask")
+    if rng is None:
+        rng = rnd
+    if isinstance(text_color, str):
+        text_color = parse_color_range(text_color)
+    if isinstance(stroke_fill, str):
+        stroke_fill = parse_color_range(stroke_fill)
+
     if orientation == 0:
         return _generate_horizontal_text(
             text,
@@ -44,6 +262,11 @@ def generate(
             word_split,
             stroke_width,
             stroke_fill,
+            rng,
+            with_mask,
+            atlas,
+            label_map,
+            whole_line,
         )
     elif orientation == 1:
         return _generate_vertical_text(
@@ -56,16 +279,104 @@ def generate(
             fit,
             stroke_width,
             stroke_fill,
+            rng,
+            with_mask,
+            label_map,
         )
     else:
         raise ValueError("Unknown orientation " + str(orientation))
 
 
+def layout_text(
+    text: str,
+    metrics: GlyphMetrics,
+    space_width: int,
+    character_spacing: int = 0,
+    word_split: bool = False,
+) -> Tuple[List[str], List[Tuple[int, int]], Tuple[int, int]]:
+    """
+    Split a horizontal text into the pieces drawn one by one, its characters
+    or with word_split its words and spaces, and place them in a single pass.
+    Returns the pieces, the (x, y) position of every piece and the size of
+    the text. The lines of the text are separated by newline pieces, which
+    are not drawn, and are as high as the highest piece.
+    """
+
+    pieces = []
+    for i, line in enumerate(text.split("\n")):
+        if i > 0:
+            pieces.append("\n")
+        if word_split:
+            for w in line.split(" "):
+                pieces.append(w)
+                pieces.append(" ")
+            pieces.pop()
+        else:
+            pieces.extend(line)
+    if word_split:
+        character_spacing = 0
+
+    line_height = max([metrics.height(p) for p in pieces if p != "\n"])
+    positions = []
+    x, y = 0, 0
+    text_width = 0
+    line_start = 0
+    for i, p in enumerate(pieces):
+        if p == "\n":
+            positions.append((x, y))
+            if i > line_start:
+                text_width = max(text_width, x - character_spacing)
+            x, y = 0, y + line_height
+            line_start = i + 1
+            continue
+        positions.append((x, y))
+        x += (metrics.advance(p) if p != " " else space_width) + character_spacing
+    if len(pieces) > line_start:
+        text_width = max(text_width, x - character_spacing)
+
+    return pieces, positions, (text_width, y + line_height)
+
+
+def wrap_text(
+    text: str,
+    font: str,
+    font_size: int,
+    max_width: float,
+    space_width: float = 1.0,
+    character_spacing: int = 0,
+) -> str:
+    """
+    Break the lines of the text that are wider than max_width pixels, when
+    drawn at font_size, between their words. The breaks replace spaces with
+    newlines, so that every character keeps its index in the text. A word
+    wider than max_width is left on a line of its own.
+    """
+
+    metrics = glyph_metrics(font, font_size)
+    space = int(metrics.length(" ") * space_width) + 2 * character_spacing
+
+    wrapped = []
+    for i, line in enumerate(text.split("\n")):
+        if i > 0:
+            wrapped.append("\n")
+        line_width = None
+        for word in line.split(" "):
+            word_width = sum(metrics.advance(c) for c in word)
+            word_width += character_spacing * max(len(word) - 1, 0)
+            if line_width is None:
+                line_width = word_width
+            elif line_width + space + word_width <= max_width:
+                wrapped.append(" ")
+                line_width += space + word_width
+            else:
+                wrapped.append("\n")
+                line_width = word_width
+            wrapped.append(word)
+    return "".join(wrapped)
+
+
 def _compute_character_width(image_font: ImageFont, character: str) -> int:
-    if len(character) == 1 and (
-        "{0:#x}".format(ord(character))
-        in TH_TONE_MARKS + TH_UNDER_VOWELS + TH_UNDER_VOWELS + TH_UPPER_VOWELS
-    ):
+    if len(character) == 1 and ord(character) in TH_ZERO_WIDTH:
         return 0
     # Casting as int to preserve the old behavior
     return round(image_font.getlength(character))
@@ -74,152 +385,344 @@ def _compute_character_width(image_font: ImageFont, character: str) -> int:
 def _generate_horizontal_text(
     text: str,
     font: str,
-    text_color: str,
+    text_color: ColorRange,
     font_size: int,
     space_width: int,
     character_spacing: int,
     fit: bool,
     word_split: bool,
-    stroke_width: int = 0,
-    stroke_fill: str = "#282828",
+    stroke_width: int,
+    stroke_fill: ColorRange,
+    rng: rnd.Random = rnd,
+    with_mask: bool = True,
+    atlas: bool = False,
+    label_map: bool = False,
+    whole_line: bool = False,
 ) -> Tuple:
-    image_font = ImageFont.truetype(font=font, size=font_size)
-
-    space_width = int(get_text_width(image_font, " ") * space_width)
-
-    if word_split:
-        splitted_text = []
-        for w in text.split(" "):
-            splitted_text.append(w)
-            splitted_text.append(" ")
-        splitted_text.pop()
-    else:
-        splitted_text = text
-
-    piece_widths = [
-        _compute_character_width(image_font, p) if p != " " else space_width
-        for p in splitted_text
-    ]
-    text_width = sum(piece_widths)
-    if not word_split:
-        text_width += character_spacing * (len(text) - 1)
-
-    text_height = max([get_text_height(image_font, p) for p in splitted_text])
-
-    txt_img = Image.new("RGBA", (text_width, text_height), (0, 0, 0, 0))
-    txt_mask = Image.new("RGB", (text_width, text_height), (0, 0, 0))
+    metrics = glyph_metrics(font, font_size)
+    image_font = metrics.image_font
+
+    # The line drawn at once keeps the kerning and ligatures of the font
+    # (shaped with raqm when Pillow has it), the characters are still drawn
+    # one by one to space them differently than the font does. Right-to-left
+    # text is already in display order (see get_display), raqm would reverse
+    # it again.
+    whole_line = (
+        whole_line
+        and not atlas
+        and space_width == 1
+        and (word_split or character_spacing == 0)
+        and not _has_rtl(text)
+    )
 
-    txt_img_draw = ImageDraw.Draw(txt_img)
-    txt_mask_draw = ImageDraw.Draw(txt_mask, mode="RGB")
-    txt_mask_draw.fontmode = "1"
+    pieces, positions, (text_width, text_height) = layout_text(
+        text,
+        metrics,
+        int(metrics.length(" ") * space_width),
+        character_spacing,
+        word_split,
+    )
 
-    colors = [ImageColor.getrgb(c) for c in text_color.split(",")]
-    c1, c2 = colors[0], colors[-1]
+    c1, c2 = text_color
 
     fill = (
-        rnd.randint(min(c1[0], c2[0]), max(c1[0], c2[0])),
-        rnd.randint(min(c1[1], c2[1]), max(c1[1], c2[1])),
-        rnd.randint(min(c1[2], c2[2]), max(c1[2], c2[2])),
+        rng.randint(min(c1[0], c2[0]), max(c1[0], c2[0])),
+        rng.randint(min(c1[1], c2[1]), max(c1[1], c2[1])),
+        rng.randint(min(c1[2], c2[2]), max(c1[2], c2[2])),
     )
 
-    stroke_colors = [ImageColor.getrgb(c) for c in stroke_fill.split(",")]
-    stroke_c1, stroke_c2 = stroke_colors[0], stroke_colors[-1]
+    stroke_c1, stroke_c2 = stroke_fill
 
     stroke_fill = (
-        rnd.randint(min(stroke_c1[0], stroke_c2[0]), max(stroke_c1[0], stroke_c2[0])),
-        rnd.randint(min(stroke_c1[1], stroke_c2[1]), max(stroke_c1[1], stroke_c2[1])),
-        rnd.randint(min(stroke_c1[2], stroke_c2[2]), max(stroke_c1[2], stroke_c2[2])),
+        rng.randint(min(stroke_c1[0], stroke_c2[0]), max(stroke_c1[0], stroke_c2[0])),
+        rng.randint(min(stroke_c1[1], stroke_c2[1]), max(stroke_c1[1], stroke_c2[1])),
+        rng.randint(min(stroke_c1[2], stroke_c2[2]), max(stroke_c1[2], stroke_c2[2])),
     )
 
-    for i, p in enumerate(splitted_text):
+    if whole_line:
+        lines = text.split("\n")
+        line_height = text_height // len(lines)
+        # The shaped line can be wider than the sum of the advances of its
+        # characters (ligatures, kerning, overhanging glyphs) or narrower, the
+        # canvas is sized from the box the font gives for it
+        boxes = [image_font.getbbox(line, stroke_width=stroke_width) for line in lines]
+        left = min(0, min(box[0] for box in boxes))
+        right = max(box[2] for box in boxes)
+        bottom = max(
+            text_height, max(i * line_height + box[3] for i, box in enumerate(boxes))
+        )
+        txt_img = Image.new("RGBA", (right - left, bottom), (0, 0, 0, 0))
+        txt_img_draw = ImageDraw.Draw(txt_img)
+        for i, line in enumerate(lines):
+            txt_img_draw.text(
+                (-left, i * line_height),
+                line,
+                fill=fill,
+                font=image_font,
+                stroke_width=stroke_width,
+                stroke_fill=stroke_fill,
+            )
+        return _crop(txt_img, None, fit)
+
+    if atlas and not word_split:
+        txt_img, labels = _blit_text(
+            pieces,
+            positions,
+            glyph_atlas(font, font_size, stroke_width),
+            (text_width, text_height),
+            fill,
+            stroke_fill,
+            with_mask,
+        )
+        return _crop(txt_img, _label_mask(labels, label_map), fit)
+
+    txt_img = Image.new("RGBA", (text_width, text_height), (0, 0, 0, 0))
+    txt_img_draw = ImageDraw.Draw(txt_img)
+
+    # Text cannot be drawn on a 16 bit image, the label map is made from the
+    # aliased glyphs of the atlas
+    draw_mask = with_mask and not label_map
+    txt_mask = None
+    if draw_mask:
+        txt_mask = Image.new("RGB", (text_width, text_height), (0, 0, 0))
+        txt_mask_draw = ImageDraw.Draw(txt_mask, mode="RGB")
+        txt_mask_draw.fontmode = "1"
+
+    for i, (p, position) in enumerate(zip(pieces, positions)):
+        if p == "\n":
+            continue
         txt_img_draw.text(
-            (sum(piece_widths[0:i]) + i * character_spacing * int(not word_split), 0),
+            position,
             p,
             fill=fill,
             font=image_font,
             stroke_width=stroke_width,
             stroke_fill=stroke_fill,
         )
-        txt_mask_draw.text(
-            (sum(piece_widths[0:i]) + i * character_spacing * int(not word_split), 0),
-            p,
-            fill=((i + 1) // (255 * 255), (i + 1) // 255, (i + 1) % 255),
-            font=image_font,
-            stroke_width=stroke_width,
-            stroke_fill=stroke_fill,
+        if draw_mask:
+            txt_mask_draw.text(
+                position,
+                p,
+                fill=((i + 1) // (255 * 255), (i + 1) // 255, (i + 1) % 255),
+                font=image_font,
+                stroke_width=stroke_width,
+                stroke_fill=stroke_fill,
+            )
+
+    if with_mask and label_map:
+        txt_mask = _label_mask(
+            _label_text(
+                pieces,
+                positions,
+                glyph_atlas(font, font_size, stroke_width),
+                (text_width, text_height),
+            ),
+            True,
         )
 
-    if fit:
-        return txt_img.crop(txt_img.getbbox()), txt_mask.crop(txt_img.getbbox())
+    return _crop(txt_img, txt_mask, fit)
+
+
+def _blit_text(
+    pieces: List[str],
+    positions: List[Tuple[int, int]],
+    atlas: GlyphAtlas,
+    size: Tuple[int, int],
+    fill: Tuple[int, int, int],
+    stroke_fill: Tuple[int, int, int],
+    with_mask: bool,
+) -> Tuple:
+    """
+    Composite the glyphs of the text at their positions. The alpha of every
+    glyph is accumulated in one coverage array, colored once at the end.
+    Returns the image and, with_mask, the label map of the text.
+    """
+
+    width, height = size
+    # Product of (1 - alpha) of the glyphs drawn over each pixel
+    fill_clear = np.ones((height, width), dtype=np.float32)
+    stroke_clear = None
+    if atlas.stroke_width:
+        stroke_clear = np.ones((height, width), dtype=np.float32)
+    label_map = np.zeros((height, width), dtype=np.int32) if with_mask else None
+
+    for i, (character, (x, y)) in enumerate(zip(pieces, positions)):
+        if character == "\n":
+            continue
+        left, top, glyph_fill, glyph_stroke, glyph_label = atlas.glyph(character)
+        clipped = _clip(x + left, y + top, glyph_fill.shape, size)
+        if clipped is None:
+            continue
+        region, tile = clipped
+        fill_clear[region] *= 1 - glyph_fill[tile]
+        if stroke_clear is not None:
+            stroke_clear[region] *= 1 - glyph_stroke[tile]
+        if label_map is not None:
+            label_map[region][glyph_label[tile]] = i + 1
+
+    txt_arr = np.empty((height, width, 4), dtype=np.uint8)
+    if stroke_clear is None:
+        txt_arr[..., :3] = fill
+        alpha = 1 - fill_clear
     else:
-        return txt_img, txt_mask
+        # The text is drawn over its stroke, blended like ImageDraw does
+        stroke_alpha = 1 - stroke_clear
+        weight = np.where(fill_clear < 1, 1 - fill_clear * stroke_alpha, 0)
+        stroke_color = np.asarray(stroke_fill, dtype=np.float32)
+        txt_arr[..., :3] = np.rint(
+            stroke_color
+            + (np.asarray(fill, dtype=np.float32) - stroke_color) * weight[..., None]
+        )
+        alpha = 1 - stroke_clear * fill_clear
+    txt_arr[..., 3] = np.rint(alpha * 255)
+
+    return Image.fromarray(txt_arr), label_map
+
+
+def _label_text(
+    pieces: List[str],
+    positions: List[Tuple[int, int]],
+    atlas: GlyphAtlas,
+    size: Tuple[int, int],
+) -> np.ndarray:
+    """
+    Label map of the pieces of a text at their positions, the pixels of the
+    i-th piece being i + 1
+    """
+
+    width, height = size
+    label_map = np.zeros((height, width), dtype=np.int32)
+    for i, (piece, (x, y)) in enumerate(zip(pieces, positions)):
+        if piece == "\n":
+            continue
+        left, top, _, _, glyph_label = atlas.glyph(piece)
+        clipped = _clip(x + left, y + top, glyph_label.shape, size)
+        if clipped is not None:
+            region, tile = clipped
+            label_map[region][glyph_label[tile]] = i + 1
+    return label_map
+
+
+def _clip(x: int, y: int, shape: Tuple[int, int], size: Tuple[int, int]) -> tuple:
+    """
+    Slices of the image and of a tile of the given shape drawn at (x, y) that
+    overlap, as ImageDraw clips the text to the image. None if they do not.
+    """
+
+    x1, y1 = min(x + shape[1], size[0]), min(y + shape[0], size[1])
+    x0, y0 = max(x, 0), max(y, 0)
+    if x0 >= x1 or y0 >= y1:
+        return None
+    return (
+        (slice(y0, y1), slice(x0, x1)),
+        (slice(y0 - y, y1 - y), slice(x0 - x, x1 - x)),
+    )
+
+
+def _label_mask(label_map: np.ndarray, as_label_map: bool) -> Image:
+    """
+    Mask of a label map, as a 16 bit label map or the RGB color coded mask
+    """
+
+    if label_map is None:
+        return None
+    if as_label_map:
+        return Image.fromarray(np.minimum(label_map, 65535).astype(np.uint16))
+    return label_map_to_mask(label_map)
 
 
 def _generate_vertical_text(
     text: str,
     font: str,
-    text_color: str,
+    text_color: ColorRange,
     font_size: int,
     space_width: int,
     character_spacing: int,
     fit: bool,
-    stroke_width: int = 0,
-    stroke_fill: str = "#282828",
+    stroke_width: int,
+    stroke_fill: ColorRange,
+    rng: rnd.Random = rnd,
+    with_mask: bool = True,
+    label_map: bool = False,
 ) -> Tuple:
-    image_font = ImageFont.truetype(font=font, size=font_size)
+    metrics = glyph_metrics(font, font_size)
+    image_font = metrics.image_font
 
-    space_height = int(get_text_height(image_font, " ") * space_width)
+    space_height = int(metrics.height(" ") * space_width)
 
-    char_heights = [
-        get_text_height(image_font, c) if c != " " else space_height for c in text
-    ]
-    text_width = max([get_text_width(image_font, c) for c in text])
+    char_heights = [metrics.height(c) if c != " " else space_height for c in text]
+    text_width = max([metrics.length(c) for c in text])
     text_height = sum(char_heights) + character_spacing * len(text)
 
     txt_img = Image.new("RGBA", (text_width, text_height), (0, 0, 0, 0))
-    txt_mask = Image.new("RGBA", (text_width, text_height), (0, 0, 0, 0))
-
     txt_img_draw = ImageDraw.Draw(txt_img)
-    txt_mask_draw = ImageDraw.Draw(txt_mask)
-    txt_mask_draw.fontmode = "1"
 
-    colors = [ImageColor.getrgb(c) for c in text_color.split(",")]
-    c1, c2 = colors[0], colors[-1]
+    draw_mask = with_mask and not label_map
+    txt_mask = None
+    if draw_mask:
+        txt_mask = Image.new("RGBA", (text_width, text_height), (0, 0, 0, 0))
+        txt_mask_draw = ImageDraw.Draw(txt_mask)
+        txt_mask_draw.fontmode = "1"
+
+    c1, c2 = text_color
 
     fill = (
-        rnd.randint(c1[0], c2[0]),
-        rnd.randint(c1[1], c2[1]),
-        rnd.randint(c1[2], c2[2]),
+        rng.randint(c1[0], c2[0]),
+        rng.randint(c1[1], c2[1]),
+        rng.randint(c1[2], c2[2]),
     )
 
-    stroke_colors = [ImageColor.getrgb(c) for c in stroke_fill.split(",")]
-    stroke_c1, stroke_c2 = stroke_colors[0], stroke_colors[-1]
+    stroke_c1, stroke_c2 = stroke_fill
 
     stroke_fill = (
-        rnd.randint(stroke_c1[0], stroke_c2[0]),
-        rnd.randint(stroke_c1[1], stroke_c2[1]),
-        rnd.randint(stroke_c1[2], stroke_c2[2]),
+        rng.randint(stroke_c1[0], stroke_c2[0]),
+        rng.randint(stroke_c1[1], stroke_c2[1]),
+        rng.randint(stroke_c1[2], stroke_c2[2]),
     )
 
+    y = 0
+    positions = []
     for i, c in enumerate(text):
+        positions.append((0, y))
         txt_img_draw.text(
-            (0, sum(char_heights[0:i]) + i * character_spacing),
+            (0, y),
             c,
             fill=fill,
             font=image_font,
             stroke_width=stroke_width,
             stroke_fill=stroke_fill,
         )
-        txt_mask_draw.text(
-            (0, sum(char_heights[0:i]) + i * character_spacing),
-            c,
-            fill=((i + 1) // (255 * 255), (i + 1) // 255, (i + 1) % 255),
-            font=image_font,
-            stroke_width=stroke_width,
-            stroke_fill=stroke_fill,
+        if draw_mask:
+            txt_mask_draw.text(
+                (0, y),
+                c,
+                fill=((i + 1) // (255 * 255), (i + 1) // 255, (i + 1) % 255),
+                font=image_font,
+                stroke_width=stroke_width,
+                stroke_fill=stroke_fill,
+            )
+        y += char_heights[i] + character_spacing
+
+    if with_mask and label_map:
+        txt_mask = _label_mask(
+            _label_text(
+                text,
+                positions,
+                glyph_atlas(font, font_size, stroke_width),
+                (text_width, text_height),
+            ),
+            True,
         )
 
-    if fit:
-        return txt_img.crop(txt_img.getbbox()), txt_mask.crop(txt_img.getbbox())
-    else:
+    return _crop(txt_img, txt_mask, fit)
+
+
+def _has_rtl(text: str) -> bool:
+    return any(unicodedata.bidirectional(c) in ("R", "AL") for c in text)
+
+
+def _crop(txt_img: Image, txt_mask: Image, fit: bool) -> Tuple:
+    if not fit:
         return txt_img, txt_mask
+    bbox = txt_img.getbbox()
+    return txt_img.crop(bbox), (txt_mask.crop(bbox) if txt_mask is not None else None)
@@ -0,0 +1,241 @@
+"""
+Run-wide generation parameters, validated and compiled once
+"""
+
+import os
+from functools import partial
+from typing import Callable, Tuple
+
+from PIL import Image
+
+from trdg import background_generator, distorsion_generator
+from trdg.computer_text_generator import parse_color_range
+
+# Parameters of FakeTextDataGenerator.generate that follow (index, text, font),
+# in the same order
+FIELDS = (
+    "out_dir",
+    "size",
+    "extension",
+    "skewing_angle",
+    "random_skew",
+    "blur",
+    "random_blur",
+    "background_type",
+    "distorsion_type",
+    "distorsion_orientation",
+    "is_handwritten",
+    "name_format",
+    "width",
+    "alignment",
+    "text_color",
+    "orientation",
+    "space_width",
+    "character_spacing",
+    "margins",
+    "fit",
+    "output_mask",
+    "word_split",
+    "image_dir",
+    "stroke_width",
+    "stroke_fill",
+    "image_mode",
+    "output_bboxes",
+    "fast_transform",
+    "glyph_atlas",
+    "wrap",
+    "mask_type",
+    "whole_line",
+)
+
+# Derived from the fields by _compile, never pickled
+COMPILED_FIELDS = ("text_colors", "stroke_colors", "distort", "background", "align")
+
+DEFAULT_IMAGE_DIR = os.path.join(os.path.dirname(__file__), "images")
+
+
+class GenerationConfig(object):
+    """
+    The parameters shared by every sample of a run. They are checked once,
+    when the config is created, and turned into ready to call stages:
+
+    - text_colors, stroke_colors: the parsed (first, last) color ranges
+    - distort(image, mask, rng): the distortion
+    - background(height, width, rng): the background generator
+    - align(background_width, text_width): the x offset of the text
+
+    A config cannot be modified, use replace to derive a new one. Only the
+    fields are pickled, the stages are compiled again when unpickling.
+    """
+
+    __slots__ = FIELDS + COMPILED_FIELDS
+
+    def __init__(
+        self,
+        out_dir: str = None,
+        size: int = 32,
+        extension: str = "jpg",
+        skewing_angle: int = 0,
+        random_skew: bool = False,
+        blur: int = 0,
+        random_blur: bool = False,
+        background_type: int = 0,
+        distorsion_type: int = 0,
+        distorsion_orientation: int = 0,
+        is_handwritten: bool = False,
+        name_format: int = 0,
+        width: int = -1,
+        alignment: int = 1,
+        text_color: str = "#282828",
+        orientation: int = 0,
+        space_width: float = 1.0,
+        character_spacing: int = 0,
+        margins: Tuple[int, int, int, int] = (5, 5, 5, 5),
+        fit: bool = False,
+        output_mask: bool = False,
+        word_split: bool = False,
+        image_dir: str = DEFAULT_IMAGE_DIR,
+        stroke_width: int = 0,
+        stroke_fill: str = "#282828",
+        image_mode: str = "RGB",
+        output_bboxes: int = 0,
+        fast_transform: bool = False,
+        glyph_atlas: bool = False,
+        wrap: bool = False,
+        mask_type: int = 0,
+        whole_line: bool = False,
+    ):
+        values = locals()
+        self.__setstate__(tuple(values[field] for field in FIELDS))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("GenerationConfig is read-only, use replace()")
+
+    def __getstate__(self) -> tuple:
+        return tuple(getattr(self, field) for field in FIELDS)
+
+    def __setstate__(self, state: tuple) -> None:
+        for field, value in zip(FIELDS, state):
+            object.__setattr__(self, field, value)
+        object.__setattr__(self, "margins", tuple(self.margins))
+        self._compile()
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, GenerationConfig):
+            return NotImplemented
+        return self.__getstate__() == other.__getstate__()
+
+    def __hash__(self) -> int:
+        return hash(self.__getstate__())
+
+    def __repr__(self) -> str:
+        return "GenerationConfig({})".format(
+            ", ".join("{}={!r}".format(field, getattr(self, field)) for field in FIELDS)
+        )
+
+    def replace(self, **changes) -> "GenerationConfig":
+        """
+        Copy of the config with some fields changed
+        """
+
+        values = dict(zip(FIELDS, self.__getstate__()))
+        for field in changes:
+            if field not in values:
+                raise TypeError("Unknown GenerationConfig field: {}".format(field))
+        values.update(changes)
+        return GenerationConfig(**values)
+
+    def _compile(self) -> None:
+        if self.orientation not in (0, 1):
+            raise ValueError("Invalid orientation")
+        if self.is_handwritten and self.orientation == 1:
+            raise ValueError("Vertical handwritten text is unavailable")
+        if self.mask_type not in (0, 1, 2):
+            raise ValueError("Invalid mask type")
+        if self.whole_line and (self.output_mask or self.output_bboxes):
+            raise ValueError("A line drawn at once has no mask or bounding boxes")
+        if self.name_format not in (0, 1, 2):
+            print(
+                "{} is not a valid name format. Using default.".format(self.name_format)
+            )
+            object.__setattr__(self, "name_format", 0)
+
+        object.__setattr__(self, "text_colors", parse_color_range(self.text_color))
+        object.__setattr__(self, "stroke_colors", parse_color_range(self.stroke_fill))
+        object.__setattr__(self, "distort", self._compile_distort())
+        object.__setattr__(self, "background", self._compile_background())
+        object.__setattr__(self, "align", self._compile_align())
+
+    def _compile_distort(self) -> Callable:
+        vertical = self.distorsion_orientation == 0 or self.distorsion_orientation == 2
+        horizontal = (
+            self.distorsion_orientation == 1 or self.distorsion_orientation == 2
+        )
+        if self.distorsion_type == 0:
+            return _no_distorsion
+        elif self.distorsion_type == 1:
+            return partial(
+                _without_rng(distorsion_generator.sin),
+                vertical=vertical,
+                horizontal=horizontal,
+            )
+        elif self.distorsion_type == 2:
+            return partial(
+                _without_rng(distorsion_generator.cos),
+                vertical=vertical,
+                horizontal=horizontal,
+            )
+        else:
+            return partial(
+                distorsion_generator.random, vertical=vertical, horizontal=horizontal
+            )
+
+    def _compile_background(self) -> Callable:
+        if self.background_type == 0:
+            return background_generator.gaussian_noise
+        elif self.background_type == 1:
+            return _without_rng(background_generator.plain_white)
+        elif self.background_type == 2:
+            return background_generator.quasicrystal
+        else:
+            return partial(background_generator.image, image_dir=self.image_dir)
+
+    def _compile_align(self) -> Callable:
+        margin_top, margin_left, margin_bottom, margin_right = self.margins
+        if self.alignment == 0 or self.width == -1:
+            return partial(_align_left, margin_left)
+        elif self.alignment == 1:
+            return _align_center
+        else:
+            return partial(_align_right, margin_right)
+
+
+class _without_rng(object):
+    """
+    Adapts a stage that makes no random choice to the (..., rng) signature
+    of the others
+    """
+
+    __slots__ = ("function",)
+
+    def __init__(self, function: Callable):
+        self.function = function
+
+    def __call__(self, *args, rng=None, **kwargs):
+        return self.function(*args, **kwargs)
+
+
+def _no_distorsion(image: Image, mask: Image, rng=None) -> Tuple:
+    return image, mask
+
+
+def _align_left(margin_left: int, background_width: int, text_width: int) -> int:
+    return margin_left
+
+
+def _align_center(background_width: int, text_width: int) -> int:
+    return int(background_width / 2 - text_width / 2)
+
+
+def _align_right(margin_right: int, background_width: int, text_width: int) -> int:
+    return background_width - text_width - margin_right
@@ -1,16 +1,127 @@
 import os
 import random as rnd
+from collections import Counter
+from typing import List, Tuple
 
+import numpy as np
 from PIL import Image, ImageFilter, ImageStat
 
-from trdg import computer_text_generator, background_generator, distorsion_generator
-from trdg.utils import mask_to_bboxes, make_filename_valid
+from trdg import computer_text_generator, transform
+from trdg.computer_text_generator import ColorRange
+from trdg.config import GenerationConfig
+from trdg.timing import NULL_TIMER, StageTimer
+from trdg.utils import (
+    encode_array,
+    encode_image,
+    label_map_to_bboxes,
+    mask_to_bboxes,
+    mask_to_label_map,
+    make_filename_valid,
+    write_files,
+)
 
 try:
     from trdg import handwritten_text_generator
 except ImportError as e:
     print("Missing modules for handwritten text generation.")
 
+# Alpha values counted as text by the contrast check, any visible pixel is
+# counted for text too thin to have mostly opaque pixels
+TEXT_ALPHA_LUT = [0] * 128 + [255] * 128
+VISIBLE_ALPHA_LUT = [0] + [255] * 255
+
+# Smallest difference of mean brightness allowed between the text and its
+# background
+MIN_CONTRAST = 15
+
+# Backgrounds drawn for a sample before it is kept with a low contrast
+MAX_BACKGROUND_ATTEMPTS = 3
+
+# Contrast fixes made by generate_from_config in this process: samples
+# generated, recolored, background_redrawn and low_contrast (kept after
+# MAX_BACKGROUND_ATTEMPTS backgrounds)
+contrast_stats = Counter()
+
+
+def contrasting_color(colors: ColorRange, background_brightness: float) -> Tuple:
+    """
+    Color of the range whose brightness is the furthest from the background:
+    its darkest or its lightest end
+    """
+
+    c1, c2 = colors
+    darkest = tuple(min(a, b) for a, b in zip(c1[:3], c2[:3]))
+    lightest = tuple(max(a, b) for a, b in zip(c1[:3], c2[:3]))
+    return max(
+        (darkest, lightest), key=lambda c: abs(sum(c) / 3 - background_brightness)
+    )
+
+
+def format_contrast_stats(stats: Counter) -> str:
+    samples = max(stats["samples"], 1)
+    return (
+        "Contrast: {} recolored ({:.1%}), {} backgrounds redrawn, "
+        "{} kept with a low contrast ({:.1%}) of {} samples"
+    ).format(
+        stats["recolored"],
+        stats["recolored"] / samples,
+        stats["background_redrawn"],
+        stats["low_contrast"],
+        stats["low_contrast"] / samples,
+        stats["samples"],
+    )
+
+
+def _fix_contrast(
+    text_img: Image, background_img: Image, config: GenerationConfig, rng
+) -> Tuple[Image, Image]:
+    """
+    Recolor the text, or draw the background again, when their brightness is
+    too close. Returns the text and background to use.
+    """
+
+    alpha = text_img.getchannel("A")
+    text_stat = ImageStat.Stat(text_img, alpha.point(TEXT_ALPHA_LUT))
+    if text_stat.count[0] == 0:
+        text_stat = ImageStat.Stat(text_img, alpha.point(VISIBLE_ALPHA_LUT))
+        if text_stat.count[0] == 0:
+            # Blank text, there is nothing to contrast
+            return text_img, background_img
+    text_brightness = _brightness(text_stat)
+    # A single colored text can be given another color of the range, a
+    # stroked or handwritten one is kept and the background is drawn again
+    recolorable = not config.is_handwritten and config.stroke_width == 0
+
+    for attempt in range(MAX_BACKGROUND_ATTEMPTS):
+        if attempt > 0:
+            width, height = background_img.size
+            background_img = config.background(height, width, rng=rng)
+            contrast_stats["background_redrawn"] += 1
+        background_brightness = _brightness(ImageStat.Stat(background_img))
+        if abs(text_brightness - background_brightness) >= MIN_CONTRAST:
+            return text_img, background_img
+        if recolorable:
+            color = contrasting_color(config.text_colors, background_brightness)
+            if abs(sum(color) / 3 - background_brightness) >= MIN_CONTRAST:
+                contrast_stats["recolored"] += 1
+                return _recolor(text_img, color), background_img
+
+    # Kept anyway, so that every requested sample is delivered
+    contrast_stats["low_contrast"] += 1
+    return text_img, background_img
+
+
+def _brightness(stat: ImageStat.Stat) -> float:
+    # Mean of the color bands, the alpha band is left out
+    bands = stat.mean[:3]
+    return sum(bands) / len(bands)
+
+
+def _recolor(image: Image, color: Tuple) -> Image:
+    return Image.merge(
+        "RGBA", Image.new("RGB", image.size, color).split() + (image.getchannel("A"),)
+    )
+
 
 class FakeTextDataGenerator(object):
     @classmethod
@@ -21,6 +132,94 @@ class FakeTextDataGenerator(object):
 
         cls.generate(*t)
 
+    @classmethod
+    def get_name(cls, index: int, text: str, name_format: int) -> str:
+        """
+        Name (without extension) of the files written for the sample
+        """
+
+        if name_format == 0:
+            name = "{}_{}".format(text, str(index))
+        elif name_format == 1:
+            name = "{}_{}".format(str(index), text)
+        elif name_format == 2:
+            name = str(index)
+        else:
+            print("{} is not a valid name format. Using default.".format(name_format))
+            name = "{}_{}".format(text, str(index))
+
+        return make_filename_valid(name, allow_unicode=True)
+
+    @classmethod
+    def get_file_names(
+        cls,
+        name: str,
+        extension: str,
+        output_mask: bool,
+        output_bboxes: int,
+        mask_type: int = 0,
+    ) -> List[str]:
+        """
+        Names of the files of a sample, in the order of encode_files
+        """
+
+        file_names = ["{}.{}".format(name, extension)]
+        if output_mask == 1:
+            file_names.append(
+                "{}_mask.{}".format(name, "npy" if mask_type == 2 else "png")
+            )
+        if output_bboxes == 1:
+            file_names.append("{}_boxes.txt".format(name))
+        if output_bboxes == 2:
+            file_names.append("{}.box".format(name))
+        return file_names
+
+    @classmethod
+    def encode_files(
+        cls,
+        name: str,
+        extension: str,
+        text: str,
+        image: Image,
+        mask: Image,
+        output_mask: bool,
+        output_bboxes: int,
+        mask_type: int = 0,
+    ) -> List[Tuple[str, bytes]]:
+        """
+        Encode the files of a sample: the image, then its mask and bounding
+        boxes if they were requested. Returns (file name, content) pairs.
+        With a mask_type of 1 or 2, the mask is a 16 bit label map, written
+        as a PNG or a .npy file.
+        """
+
+        contents = [encode_image(image, extension)]
+        if output_mask == 1:
+            if mask_type == 2:
+                contents.append(encode_array(np.asarray(mask)))
+            else:
+                contents.append(encode_image(mask, "png"))
+        to_bboxes = mask_to_bboxes if mask_type == 0 else label_map_to_bboxes
+        if output_bboxes == 1:
+            bboxes = to_bboxes(mask)
+            contents.append(
+                "".join(
+                    " ".join([str(v) for v in bbox]) + "\n" for bbox in bboxes
+                ).encode("utf8")
+            )
+        if output_bboxes == 2:
+            bboxes = to_bboxes(mask, tess=True)
+            contents.append(
+                "".join(
+                    " ".join([char] + [str(v) for v in bbox] + ["0"]) + "\n"
+                    for bbox, char in zip(bboxes, text)
+                ).encode("utf8")
+            )
+        file_names = cls.get_file_names(
+            name, extension, output_mask, output_bboxes, mask_type
+        )
+        return list(zip(file_names, contents))
+
     @classmethod
     def generate(
         cls,
@@ -54,237 +253,372 @@ class FakeTextDataGenerator(object):
         stroke_fill: str = "#282828",
         image_mode: str = "RGB",
         output_bboxes: int = 0,
+        fast_transform: bool = False,
+        glyph_atlas: bool = False,
+        wrap: bool = False,
+        mask_type: int = 0,
+        whole_line: bool = False,
+        seed: int = None,
+        return_files: bool = False,
+        metadata: dict = None,
     ) -> Image:
+        """
+        Same as generate_from_config, with the parameters of the config given
+        one by one
+        """
+
+        config = GenerationConfig(
+            out_dir,
+            size,
+            extension,
+            skewing_angle,
+            random_skew,
+            blur,
+            random_blur,
+            background_type,
+            distorsion_type,
+            distorsion_orientation,
+            is_handwritten,
+            name_format,
+            width,
+            alignment,
+            text_color,
+            orientation,
+            space_width,
+            character_spacing,
+            margins,
+            fit,
+            output_mask,
+            word_split,
+            image_dir,
+            stroke_width,
+            stroke_fill,
+            image_mode,
+            output_bboxes,
+            fast_transform,
+            glyph_atlas,
+            wrap,
+            mask_type,
+            whole_line,
+        )
+        return cls.generate_from_config(
+            index,
+            text,
+            font,
+            config,
+            seed=seed,
+            return_files=return_files,
+            metadata=metadata,
+        )
+
+    @classmethod
+    def generate_from_config(
+        cls,
+        index: int,
+        text: str,
+        font: str,
+        config: GenerationConfig,
+        seed: int = None,
+        return_files: bool = False,
+        metadata: dict = None,
+        output: str = "pil",
+        timer: StageTimer = None,
+    ) -> Image:
+        """
+        Render one sample. When a metadata dict is given, it is filled with
+        the font, size, skew, blur, background and bounding boxes of the
+        sample. A text too close to its background is recolored or given
+        another background.
+
+        Without out_dir, the image (and mask) is returned as a PIL image, or
+        with output="numpy" as a read-only uint8 HxWxC array (HxW for single
+        band modes) and a uint16 HxW label map where the pixels of the i-th
+        character are i + 1 and the background 0. The stages are PIL ones up
+        to the blur, so the array is a copy of the final PIL image, the same
+        one the caller would make: output="numpy" does not skip PIL, it only
+        spares the mask its mode change and blur. With a mask_type of 1 or 2,
+        the mask is carried as such a label map from the start, and returned
+        as an "I;16" image.
+
+        When a StageTimer is given, the time spent in every stage is added to
+        it.
+        """
+
         image = None
 
-        margin_top, margin_left, margin_bottom, margin_right = margins
+        if timer is None:
+            timer = NULL_TIMER
+        timer.start()
+
+        # Every random choice made for this sample comes from rng, so that a
+        # given seed always produces the same sample
+        rng = rnd.Random(seed) if seed is not None else rnd
+
+        size = config.size
+        orientation = config.orientation
+        skewing_angle = config.skewing_angle
+        blur = config.blur
+        margin_top, margin_left, margin_bottom, margin_right = config.margins
         horizontal_margin = margin_left + margin_right
         vertical_margin = margin_top + margin_bottom
 
+        # The character mask is only carried through the pipeline when it is
+        # written, returned or used for the bounding boxes. It never changes
+        # how the text is drawn, a line drawn at once has no boxes.
+        with_mask = (
+            config.output_mask == 1
+            or config.output_bboxes != 0
+            or (metadata is not None and not config.whole_line)
+        )
+        # With a mask_type of 1 or 2, the mask is a 16 bit label map from the
+        # rendering to the files
+        label_maps = config.mask_type != 0
+
         ##########################
         # Create picture of text #
         ##########################
-        if is_handwritten:
-            if orientation == 1:
-                raise ValueError("Vertical handwritten text is unavailable")
-            image, mask = handwritten_text_generator.generate(text, text_color)
+        line_count = 1
+        if config.is_handwritten:
+            image, mask = handwritten_text_generator.generate(
+                text, config.text_color, rng
+            )
+            if not with_mask:
+                mask = None
+            elif label_maps:
+                mask = Image.fromarray(mask_to_label_map(mask))
         else:
+            drawn_text = text
+            if config.wrap and config.width > 0 and orientation == 0:
+                # The text is drawn with a font of size pixels, then scaled so
+                # that a line is size - vertical_margin pixels high
+                metrics = computer_text_generator.glyph_metrics(font, size)
+                line_height = max(metrics.height(c) for c in text if c != "\n")
+                drawn_text = computer_text_generator.wrap_text(
+                    text,
+                    font,
+                    size,
+                    (config.width - horizontal_margin)
+                    * line_height
+                    / (size - vertical_margin),
+                    config.space_width,
+                    config.character_spacing,
+                )
+            if orientation == 0:
+                line_count = drawn_text.count("\n") + 1
             image, mask = computer_text_generator.generate(
-                text,
+                drawn_text,
                 font,
-                text_color,
+                config.text_colors,
                 size,
                 orientation,
-                space_width,
-                character_spacing,
-                fit,
-                word_split,
-                stroke_width,
-                stroke_fill,
+                config.space_width,
+                config.character_spacing,
+                config.fit,
+                config.word_split,
+                config.stroke_width,
+                config.stroke_colors,
+                rng,
+                with_mask,
+                config.glyph_atlas,
+                label_maps,
+                config.whole_line,
             )
-        random_angle = rnd.randint(0 - skewing_angle, skewing_angle)
+        timer.lap("render")
 
-        rotated_img = image.rotate(
-            skewing_angle if not random_skew else random_angle, expand=1
-        )
+        random_angle = rng.randint(0 - skewing_angle, skewing_angle)
+        angle = skewing_angle if not config.random_skew else random_angle
 
-        rotated_mask = mask.rotate(
-            skewing_angle if not random_skew else random_angle, expand=1
-        )
-
-        #############################
-        # Apply distortion to image #
-        #############################
-        if distorsion_type == 0:
-            distorted_img = rotated_img  # Mind = blown
-            distorted_mask = rotated_mask
-        elif distorsion_type == 1:
-            distorted_img, distorted_mask = distorsion_generator.sin(
-                rotated_img,
-                rotated_mask,
-                vertical=(distorsion_orientation == 0 or distorsion_orientation == 2),
-                horizontal=(distorsion_orientation == 1 or distorsion_orientation == 2),
-            )
-        elif distorsion_type == 2:
-            distorted_img, distorted_mask = distorsion_generator.cos(
-                rotated_img,
-                rotated_mask,
-                vertical=(distorsion_orientation == 0 or distorsion_orientation == 2),
-                horizontal=(distorsion_orientation == 1 or distorsion_orientation == 2),
+        if config.fast_transform and config.distorsion_type == 0:
+            ######################################
+            # Rotate and resize in a single warp #
+            ######################################
+            resized_img, resized_mask = transform.rotate_and_resize(
+                image,
+                mask,
+                angle,
+                (
+                    (size - vertical_margin) * line_count
+                    if orientation == 0
+                    else size - horizontal_margin
+                ),
+                orientation,
             )
+            timer.lap("transform")
         else:
-            distorted_img, distorted_mask = distorsion_generator.random(
-                rotated_img,
-                rotated_mask,
-                vertical=(distorsion_orientation == 0 or distorsion_orientation == 2),
-                horizontal=(distorsion_orientation == 1 or distorsion_orientation == 2),
+            rotated_img = image.rotate(angle, expand=1)
+
+            rotated_mask = mask.rotate(angle, expand=1) if with_mask else None
+            timer.lap("rotate")
+
+            #############################
+            # Apply distortion to image #
+            #############################
+            distorted_img, distorted_mask = config.distort(
+                rotated_img, rotated_mask, rng=rng
             )
+            timer.lap("distort")
 
-        ##################################
-        # Resize image to desired format #
-        ##################################
+            ##################################
+            # Resize image to desired format #
+            ##################################
+
+            # Horizontal text
+            if orientation == 0:
+                new_height = (size - vertical_margin) * line_count
+                new_width = int(
+                    distorted_img.size[0]
+                    * (float(new_height) / float(distorted_img.size[1]))
+                )
+                resized_img = distorted_img.resize(
+                    (new_width, new_height), Image.Resampling.LANCZOS
+                )
+                if with_mask:
+                    resized_mask = distorted_mask.resize(
+                        (new_width, new_height), Image.Resampling.NEAREST
+                    )
+            # Vertical text
+            else:
+                new_height = int(
+                    float(distorted_img.size[1])
+                    * (float(size - horizontal_margin) / float(distorted_img.size[0]))
+                )
+                resized_img = distorted_img.resize(
+                    (size - horizontal_margin, new_height), Image.Resampling.LANCZOS
+                )
+                if with_mask:
+                    resized_mask = distorted_mask.resize(
+                        (size - horizontal_margin, new_height),
+                        Image.Resampling.NEAREST,
+                    )
+            timer.lap("resize")
 
-        # Horizontal text
         if orientation == 0:
-            new_width = int(
-                distorted_img.size[0]
-                * (float(size - vertical_margin) / float(distorted_img.size[1]))
-            )
-            resized_img = distorted_img.resize(
-                (new_width, size - vertical_margin), Image.Resampling.LANCZOS
-            )
-            resized_mask = distorted_mask.resize(
-                (new_width, size - vertical_margin), Image.Resampling.NEAREST
-            )
-            background_width = width if width > 0 else new_width + horizontal_margin
-            background_height = size
-        # Vertical text
-        elif orientation == 1:
-            new_height = int(
-                float(distorted_img.size[1])
-                * (float(size - horizontal_margin) / float(distorted_img.size[0]))
+            background_width = (
+                config.width
+                if config.width > 0
+                else resized_img.size[0] + horizontal_margin
             )
-            resized_img = distorted_img.resize(
-                (size - horizontal_margin, new_height), Image.Resampling.LANCZOS
-            )
-            resized_mask = distorted_mask.resize(
-                (size - horizontal_margin, new_height), Image.Resampling.NEAREST
-            )
-            background_width = size
-            background_height = new_height + vertical_margin
+            background_height = resized_img.size[1] + vertical_margin
         else:
-            raise ValueError("Invalid orientation")
+            background_width = size
+            background_height = resized_img.size[1] + vertical_margin
 
         #############################
         # Generate background image #
         #############################
-        if background_type == 0:
-            background_img = background_generator.gaussian_noise(
-                background_height, background_width
-            )
-        elif background_type == 1:
-            background_img = background_generator.plain_white(
-                background_height, background_width
-            )
-        elif background_type == 2:
-            background_img = background_generator.quasicrystal(
-                background_height, background_width
-            )
-        else:
-            background_img = background_generator.image(
-                background_height, background_width, image_dir
-            )
-        background_mask = Image.new(
-            "RGB", (background_width, background_height), (0, 0, 0)
-        )
-
-        ##############################################################
-        # Comparing average pixel value of text and background image #
-        ##############################################################
-        try:
-            resized_img_st = ImageStat.Stat(resized_img, resized_mask.split()[2])
-            background_img_st = ImageStat.Stat(background_img)
+        background_img = config.background(background_height, background_width, rng=rng)
+        timer.lap("background")
 
-            resized_img_px_mean = sum(resized_img_st.mean[:2]) / 3
-            background_img_px_mean = sum(background_img_st.mean) / 3
-
-            if abs(resized_img_px_mean - background_img_px_mean) < 15:
-                print("value of mean pixel is too similar. Ignore this image")
-
-                print("resized_img_st \n {}".format(resized_img_st.mean))
-                print("background_img_st \n {}".format(background_img_st.mean))
-
-                return
-        except Exception as err:
-            return
+        ####################################################
+        # Make sure the text stands out from its background #
+        ####################################################
+        contrast_stats["samples"] += 1
+        resized_img, background_img = _fix_contrast(
+            resized_img, background_img, config, rng
+        )
+        timer.lap("contrast")
 
         #############################
         # Place text with alignment #
         #############################
 
         new_text_width, _ = resized_img.size
+        text_position = (config.align(background_width, new_text_width), margin_top)
 
-        if alignment == 0 or width == -1:
-            background_img.paste(resized_img, (margin_left, margin_top), resized_img)
-            background_mask.paste(resized_mask, (margin_left, margin_top))
-        elif alignment == 1:
-            background_img.paste(
-                resized_img,
-                (int(background_width / 2 - new_text_width / 2), margin_top),
-                resized_img,
-            )
-            background_mask.paste(
-                resized_mask,
-                (int(background_width / 2 - new_text_width / 2), margin_top),
-            )
-        else:
-            background_img.paste(
-                resized_img,
-                (background_width - new_text_width - margin_right, margin_top),
-                resized_img,
-            )
-            background_mask.paste(
-                resized_mask,
-                (background_width - new_text_width - margin_right, margin_top),
+        background_img.paste(resized_img, text_position, resized_img)
+        if with_mask:
+            background_mask = Image.new(
+                "I;16" if label_maps else "RGB",
+                (background_width, background_height),
+                0 if label_maps else (0, 0, 0),
             )
+            background_mask.paste(resized_mask, text_position)
 
         ############################################
         # Change image mode (RGB, grayscale, etc.) #
         ############################################
 
-        background_img = background_img.convert(image_mode)
-        background_mask = background_mask.convert(image_mode)
+        background_img = background_img.convert(config.image_mode)
+        # A label map is read from the mask before any change, the image mode
+        # and blur are only applied to an RGB mask returned as an image or
+        # written
+        as_label_map = label_maps or (config.out_dir is None and output == "numpy")
+        if with_mask:
+            sharp_mask = background_mask
+            if not as_label_map:
+                background_mask = background_mask.convert(config.image_mode)
+
+        timer.lap("composite")
 
         #######################
         # Apply gaussian blur #
         #######################
 
-        gaussian_filter = ImageFilter.GaussianBlur(
-            radius=blur if not random_blur else rnd.random() * blur
-        )
+        radius = blur if not config.random_blur else rng.random() * blur
+        gaussian_filter = ImageFilter.GaussianBlur(radius=radius)
         final_image = background_img.filter(gaussian_filter)
-        final_mask = background_mask.filter(gaussian_filter)
+        final_mask = None
+        if with_mask and label_maps:
+            final_mask = sharp_mask
+        elif with_mask and not as_label_map:
+            final_mask = background_mask.filter(gaussian_filter)
+        timer.lap("blur")
 
         #####################################
         # Generate name for resulting image #
         #####################################
         # We remove spaces if space_width == 0
-        if space_width == 0:
+        if config.space_width == 0:
             text = text.replace(" ", "")
-        if name_format == 0:
-            name = "{}_{}".format(text, str(index))
-        elif name_format == 1:
-            name = "{}_{}".format(str(index), text)
-        elif name_format == 2:
-            name = str(index)
-        else:
-            print("{} is not a valid name format. Using default.".format(name_format))
-            name = "{}_{}".format(text, str(index))
+        name = cls.get_name(index, text, config.name_format)
+        image_name = "{}.{}".format(name, config.extension)
 
-        name = make_filename_valid(name, allow_unicode=True)
-        image_name = "{}.{}".format(name, extension)
-        mask_name = "{}_mask.png".format(name)
-        box_name = "{}_boxes.txt".format(name)
-        tess_box_name = "{}.box".format(name)
+        if metadata is not None:
+            metadata.update(
+                font=font,
+                size=list(final_image.size),
+                skew=angle,
+                blur=radius,
+                background=config.background_type,
+            )
+            if with_mask:
+                # The boxes are read from the mask before blur and mode
+                # change, which alter its character colors
+                bboxes = (
+                    label_map_to_bboxes(sharp_mask)
+                    if label_maps
+                    else mask_to_bboxes(sharp_mask)
+                )
+                metadata["bboxes"] = [[int(v) for v in bbox] for bbox in bboxes]
+            timer.lap("metadata")
 
         # Save the image
-        if out_dir is not None:
-            final_image.save(os.path.join(out_dir, image_name))
-            if output_mask == 1:
-                final_mask.save(os.path.join(out_dir, mask_name))
-            if output_bboxes == 1:
-                bboxes = mask_to_bboxes(final_mask)
-                with open(os.path.join(out_dir, box_name), "w") as f:
-                    for bbox in bboxes:
-                        f.write(" ".join([str(v) for v in bbox]) + "\n")
-            if output_bboxes == 2:
-                bboxes = mask_to_bboxes(final_mask, tess=True)
-                with open(os.path.join(out_dir, tess_box_name), "w") as f:
-                    for bbox, char in zip(bboxes, text):
-                        f.write(
-                            " ".join([char] + [str(v) for v in bbox] + ["0"]) + "\n"
-                        )
+        if config.out_dir is not None:
+            files = cls.encode_files(
+                name,
+                config.extension,
+                text,
+                final_image,
+                final_mask,
+                config.output_mask,
+                config.output_bboxes,
+                config.mask_type,
+            )
+            timer.lap("encode")
+            if return_files:
+                return image_name, files
+            write_files(config.out_dir, files)
+            timer.lap("write")
+            return image_name
+        elif output == "numpy":
+            if config.output_mask == 1:
+                return np.asarray(final_image), (
+                    np.asarray(sharp_mask)
+                    if label_maps
+                    else mask_to_label_map(sharp_mask)
+                )
+            return np.asarray(final_image)
         else:
-            if output_mask == 1:
+            if config.output_mask == 1:
                 return final_image, final_mask
             return final_image
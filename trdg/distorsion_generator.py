@@ -12,7 +12,7 @@ def _apply_func_distorsion(
     image: Image, mask: Image, vertical: bool, horizontal: bool, max_offset: int, func
 ) -> Tuple:
     """
-    Apply a distortion to an image
+    Apply a distortion to an image, and to its mask unless it is None
     """
 
     # Nothing to do!
@@ -21,10 +21,15 @@ def _apply_func_distorsion(
 
     # FIXME: From looking at the code I think both are already RGBA
     rgb_image = image.convert("RGBA")
-    rgb_mask = mask.convert("RGB")
 
     img_arr = np.array(rgb_image)
-    mask_arr = np.array(rgb_mask)
+    with_mask = mask is not None
+    # A 16 bit label map is moved as a single channel, the other masks as RGB
+    label_map = with_mask and mask.mode == "I;16"
+    if label_map:
+        mask_arr = np.array(mask)[..., None]
+    elif with_mask:
+        mask_arr = np.array(mask.convert("RGB"))
 
     vertical_offsets = [func(i) for i in range(img_arr.shape[1])]
     horizontal_offsets = [
@@ -49,17 +54,19 @@ def _apply_func_distorsion(
 
     new_img_arr_copy = np.copy(new_img_arr)
 
-    new_mask_arr = np.zeros(
-        (
-            # I keep img_arr to maximise the chance of
-            # a breakage if img and mask don't match
-            img_arr.shape[0] + (2 * max_offset if vertical else 0),
-            img_arr.shape[1] + (2 * max_offset if horizontal else 0),
-            3,
+    if with_mask:
+        new_mask_arr = np.zeros(
+            (
+                # I keep img_arr to maximise the chance of
+                # a breakage if img and mask don't match
+                img_arr.shape[0] + (2 * max_offset if vertical else 0),
+                img_arr.shape[1] + (2 * max_offset if horizontal else 0),
+                mask_arr.shape[2],
+            ),
+            dtype=mask_arr.dtype,
         )
-    )
 
-    new_mask_arr_copy = np.copy(new_mask_arr)
+        new_mask_arr_copy = np.copy(new_mask_arr)
 
     if vertical:
         column_height = img_arr.shape[0]
@@ -68,9 +75,10 @@ def _apply_func_distorsion(
             new_img_arr[
                 max_offset + o : column_height + max_offset + o, column_pos, :
             ] = img_arr[:, i, :]
-            new_mask_arr[
-                max_offset + o : column_height + max_offset + o, column_pos, :
-            ] = mask_arr[:, i, :]
+            if with_mask:
+                new_mask_arr[
+                    max_offset + o : column_height + max_offset + o, column_pos, :
+                ] = mask_arr[:, i, :]
 
     if horizontal:
         row_width = img_arr.shape[1]
@@ -79,21 +87,33 @@ def _apply_func_distorsion(
                 new_img_arr_copy[
                     i, max_offset + o : row_width + max_offset + o, :
                 ] = new_img_arr[i, max_offset : row_width + max_offset, :]
-                new_mask_arr_copy[
-                    i, max_offset + o : row_width + max_offset + o, :
-                ] = new_mask_arr[i, max_offset : row_width + max_offset, :]
+                if with_mask:
+                    new_mask_arr_copy[
+                        i, max_offset + o : row_width + max_offset + o, :
+                    ] = new_mask_arr[i, max_offset : row_width + max_offset, :]
             else:
                 new_img_arr[
                     i, max_offset + o : row_width + max_offset + o, :
                 ] = img_arr[i, :, :]
-                new_mask_arr[
-                    i, max_offset + o : row_width + max_offset + o, :
-                ] = mask_arr[i, :, :]
-
+                if with_mask:
+                    new_mask_arr[
+                        i, max_offset + o : row_width + max_offset + o, :
+                    ] = mask_arr[i, :, :]
+
+    new_image = Image.fromarray(
+        np.uint8(new_img_arr_copy if horizontal and vertical else new_img_arr)
+    ).convert("RGBA")
+    if not with_mask:
+        return new_image, None
+    if label_map:
+        return (
+            new_image,
+            Image.fromarray(
+                (new_mask_arr_copy if horizontal and vertical else new_mask_arr)[..., 0]
+            ),
+        )
     return (
-        Image.fromarray(
-            np.uint8(new_img_arr_copy if horizontal and vertical else new_img_arr)
-        ).convert("RGBA"),
+        new_image,
         Image.fromarray(
             np.uint8(new_mask_arr_copy if horizontal and vertical else new_mask_arr)
         ).convert("RGB"),
@@ -139,12 +159,19 @@ def cos(
 
 
 def random(
-    image: Image, mask: Image, vertical: bool = False, horizontal: bool = False
+    image: Image,
+    mask: Image,
+    vertical: bool = False,
+    horizontal: bool = False,
+    rng: rnd.Random = None,
 ) -> Tuple:
     """
     Apply a random distortion on one or both of the specified axis
     """
 
+    if rng is None:
+        rng = rnd
+
     max_offset = int(image.height**0.4)
 
     return _apply_func_distorsion(
@@ -153,5 +180,5 @@ def random(
         vertical,
         horizontal,
         max_offset,
-        (lambda x: rnd.randint(0, max_offset)),
+        (lambda x: rng.randint(0, max_offset)),
     )
@@ -0,0 +1,115 @@
+from typing import Callable, List, Tuple
+
+import numpy as np
+from PIL import Image
+
+from trdg.config import GenerationConfig
+
+
+def next_batch(
+    generator, config: GenerationConfig, n: int, pad_to: int = None
+) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+    """
+    Draw n samples from generator into one (n, H, W, C) uint8 array, padded
+    with zeros to a width of pad_to, or of the widest image of the batch.
+    Returns the array, the width of every image and the labels. The batch is
+    shorter than n when the generator runs out. The masks are not batched.
+    """
+
+    if config.orientation != 0:
+        raise ValueError("Batches are only available for horizontal text")
+    if config.wrap:
+        raise ValueError("Batches are not available for text wrapped in lines")
+    if n <= 0:
+        raise ValueError("The batch size must be positive")
+
+    # The width is known in advance when the images are padded to a given
+    # width or all have the same one, they are then copied in place as they
+    # are generated
+    width = pad_to if pad_to is not None else config.width
+    batch = None
+    if width > 0:
+        batch = np.zeros(
+            (n, config.size, width, _channels(config.image_mode)), dtype=np.uint8
+        )
+    images = []
+    widths = np.zeros(n, dtype=np.int64)
+    labels = []
+
+    while len(labels) < n:
+        try:
+            image, label = next(generator)
+        except StopIteration:
+            break
+        if isinstance(image, tuple):
+            image = image[0]
+        image = np.asarray(image)
+        h, w = image.shape[:2]
+        if batch is not None:
+            if w > width:
+                raise ValueError(
+                    "Image of width {} larger than pad_to={}, set width to "
+                    "generate images of a fixed width".format(w, width)
+                )
+            batch[len(labels), :h, :w] = image.reshape(h, w, -1)
+        else:
+            images.append(image)
+        widths[len(labels)] = w
+        labels.append(label)
+
+    if len(labels) == 0:
+        raise StopIteration
+
+    if batch is None:
+        batch = np.zeros(
+            (len(labels), config.size, int(widths.max()), _channels(config.image_mode)),
+            dtype=np.uint8,
+        )
+        for i, image in enumerate(images):
+            h, w = image.shape[:2]
+            batch[i, :h, :w] = image.reshape(h, w, -1)
+
+    return batch[: len(labels)], widths[: len(labels)], labels
+
+
+class BatchGenerator(object):
+    """
+    Base of the generators: next_batch draws the samples of next() into one
+    array, with the GenerationConfig of the generator
+    """
+
+    def next_batch(self, n: int, pad_to: int = None):
+        """
+        Next n samples as one padded (n, H, W, C) uint8 array, the width of
+        every image and the labels, see trdg.generators.batch.next_batch
+        """
+
+        return next_batch(self, self.config, n, pad_to)
+
+
+class StringBatchGenerator(BatchGenerator):
+    """
+    Base of the generators that create their strings by batches of
+    batch_size and generate the samples with a GeneratorFromStrings
+    """
+
+    @property
+    def config(self) -> GenerationConfig:
+        return self.generator.config
+
+    def next_from_strings(self, create_strings: Callable[[], List[str]]):
+        """
+        Next sample of the GeneratorFromStrings, after giving it a new batch
+        of strings from create_strings when it used the current one
+        """
+
+        # A shard starts past the first batches, draw them to stay in sync
+        while self.generator.generated_count >= self.steps_until_regeneration:
+            self.generator.strings = create_strings()
+            self.steps_until_regeneration += self.batch_size
+        return self.generator.next()
+
+
+def _channels(image_mode: str) -> int:
+    # The name of a mode is not its bands, e.g. "YCbCr" or "I;16"
+    return len(Image.new(image_mode, (1, 1)).getbands())
@@ -1,13 +1,16 @@
 import os
+import random as rnd
 from typing import List, Tuple
 
+from trdg.generators.batch import StringBatchGenerator
 from trdg.generators.from_strings import GeneratorFromStrings
+from trdg.config import GenerationConfig
 from trdg.data_generator import FakeTextDataGenerator
 from trdg.string_generator import create_strings_from_dict
 from trdg.utils import load_dict, load_fonts
 
 
-class GeneratorFromDict:
+class GeneratorFromDict(StringBatchGenerator):
     """Generator that uses words taken from pre-packaged dictionaries"""
 
     def __init__(
@@ -45,6 +48,11 @@ class GeneratorFromDict:
         output_bboxes: int = 0,
         path: str = "",
         rtl: bool = False,
+        seed: int = None,
+        shard_index: int = 0,
+        shard_count: int = 1,
+        config: GenerationConfig = None,
+        output: str = "pil",
     ):
         self.count = count
         self.length = length
@@ -59,12 +67,14 @@ class GeneratorFromDict:
         else:
             self.dict = load_dict(path)
 
+        self.rng = rnd.Random(seed) if seed is not None else rnd
+
         self.batch_size = min(max(count, 1), 1000)
         self.steps_until_regeneration = self.batch_size
 
         self.generator = GeneratorFromStrings(
             create_strings_from_dict(
-                self.length, self.allow_variable, self.batch_size, self.dict
+                self.length, self.allow_variable, self.batch_size, self.dict, self.rng
             ),
             count,
             fonts if len(fonts) else load_fonts(language),
@@ -94,6 +104,11 @@ class GeneratorFromDict:
             image_mode,
             output_bboxes,
             rtl,
+            seed,
+            shard_index,
+            shard_count,
+            config,
+            output=output,
         )
 
     def __iter__(self):
@@ -103,9 +118,8 @@ class GeneratorFromDict:
         return self.next()
 
     def next(self):
-        if self.generator.generated_count >= self.steps_until_regeneration:
-            self.generator.strings = create_strings_from_dict(
-                self.length, self.allow_variable, self.batch_size, self.dict
+        return self.next_from_strings(
+            lambda: create_strings_from_dict(
+                self.length, self.allow_variable, self.batch_size, self.dict, self.rng
             )
-            self.steps_until_regeneration += self.batch_size
-        return self.generator.next()
+        )
@@ -1,13 +1,16 @@
 import os
+import random as rnd
 from typing import List, Tuple
 
+from trdg.generators.batch import StringBatchGenerator
 from trdg.generators.from_strings import GeneratorFromStrings
+from trdg.config import GenerationConfig
 from trdg.data_generator import FakeTextDataGenerator
 from trdg.string_generator import create_strings_randomly
 from trdg.utils import load_dict, load_fonts
 
 
-class GeneratorFromRandom:
+class GeneratorFromRandom(StringBatchGenerator):
     """Generator that uses randomly generated words"""
 
     def __init__(
@@ -46,6 +49,11 @@ class GeneratorFromRandom:
         stroke_fill: str = "#282828",
         image_mode: str = "RGB",
         output_bboxes: int = 0,
+        seed: int = None,
+        shard_index: int = 0,
+        shard_count: int = 1,
+        config: GenerationConfig = None,
+        output: str = "pil",
     ):
         self.generated_count = 0
         self.count = count
@@ -56,6 +64,8 @@ class GeneratorFromRandom:
         self.use_symbols = use_symbols
         self.language = language
 
+        self.rng = rnd.Random(seed) if seed is not None else rnd
+
         self.batch_size = min(max(count, 1), 1000)
         self.steps_until_regeneration = self.batch_size
         self.generator = GeneratorFromStrings(
@@ -67,6 +77,7 @@ class GeneratorFromRandom:
                 self.use_numbers,
                 self.use_symbols,
                 self.language,
+                self.rng,
             ),
             count,
             fonts if len(fonts) else load_fonts(language),
@@ -95,6 +106,11 @@ class GeneratorFromRandom:
             stroke_fill,
             image_mode,
             output_bboxes,
+            seed=seed,
+            shard_index=shard_index,
+            shard_count=shard_count,
+            config=config,
+            output=output,
         )
 
     def __iter__(self):
@@ -107,8 +123,8 @@ class GeneratorFromRandom:
         return self.next()
 
     def next(self):
-        if self.generator.generated_count >= self.steps_until_regeneration:
-            self.generator.strings = create_strings_randomly(
+        return self.next_from_strings(
+            lambda: create_strings_randomly(
                 self.length,
                 self.allow_variable,
                 self.batch_size,
@@ -116,6 +132,6 @@ class GeneratorFromRandom:
                 self.use_numbers,
                 self.use_symbols,
                 self.language,
+                self.rng,
             )
-            self.steps_until_regeneration += self.batch_size
-        return self.generator.next()
+        )
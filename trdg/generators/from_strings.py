@@ -1,15 +1,17 @@
 import os
 from typing import List, Tuple
 
+from trdg.config import GenerationConfig
+from trdg.generators.batch import BatchGenerator
 from trdg.data_generator import FakeTextDataGenerator
-from trdg.utils import load_dict, load_fonts
+from trdg.utils import derive_seed, load_dict, load_fonts, shard_range
 
 # support RTL
 from arabic_reshaper import ArabicReshaper
 from bidi.algorithm import get_display
 
 
-class GeneratorFromStrings:
+class GeneratorFromStrings(BatchGenerator):
     """Generator that uses a given list of strings"""
 
     def __init__(
@@ -45,7 +47,23 @@ class GeneratorFromStrings:
         image_mode: str = "RGB",
         output_bboxes: int = 0,
         rtl: bool = False,
+        seed: int = None,
+        shard_index: int = 0,
+        shard_count: int = 1,
+        config: GenerationConfig = None,
+        output: str = "pil",
     ):
+        """
+        The generation parameters can be given one by one, or all at once as
+        a GenerationConfig, which then takes precedence over them. With
+        output="numpy", the images are NumPy arrays and the masks label maps,
+        see FakeTextDataGenerator.generate_from_config.
+        """
+
+        if output not in ("pil", "numpy"):
+            raise ValueError("Unknown output {}".format(output))
+        self.output = output
+
         self.count = count
         self.strings = strings
         self.fonts = fonts
@@ -89,6 +107,43 @@ class GeneratorFromStrings:
         self.stroke_width = stroke_width
         self.stroke_fill = stroke_fill
         self.image_mode = image_mode
+        self.seed = seed
+        if shard_count > 1:
+            # Only generate this shard's contiguous range of the count samples
+            if count < 0:
+                raise ValueError("A positive count is required to use shards")
+            self.generated_count, self.count = shard_range(
+                count, shard_index, shard_count
+            )
+        if config is None:
+            config = GenerationConfig(
+                size=size,
+                skewing_angle=skewing_angle,
+                random_skew=random_skew,
+                blur=blur,
+                random_blur=random_blur,
+                background_type=background_type,
+                distorsion_type=distorsion_type,
+                distorsion_orientation=distorsion_orientation,
+                is_handwritten=is_handwritten,
+                width=width,
+                alignment=alignment,
+                text_color=text_color,
+                orientation=orientation,
+                space_width=space_width,
+                character_spacing=character_spacing,
+                margins=margins,
+                fit=fit,
+                output_mask=output_mask,
+                word_split=word_split,
+                image_dir=image_dir,
+                stroke_width=stroke_width,
+                stroke_fill=stroke_fill,
+                image_mode=image_mode,
+                output_bboxes=output_bboxes,
+            )
+        # The images are returned, never written
+        self.config = config.replace(out_dir=None)
 
     def __iter__(self):
         return self
@@ -99,43 +154,21 @@ class GeneratorFromStrings:
     def next(self):
         if self.generated_count == self.count:
             raise StopIteration
+        # Samples are seeded from their 0-based index, as in run.py
+        index = self.generated_count
         self.generated_count += 1
         return (
-            FakeTextDataGenerator.generate(
-                self.generated_count,
-                self.strings[(self.generated_count - 1) % len(self.strings)],
-                self.fonts[(self.generated_count - 1) % len(self.fonts)],
-                None,
-                self.size,
-                None,
-                self.skewing_angle,
-                self.random_skew,
-                self.blur,
-                self.random_blur,
-                self.background_type,
-                self.distorsion_type,
-                self.distorsion_orientation,
-                self.is_handwritten,
-                0,
-                self.width,
-                self.alignment,
-                self.text_color,
-                self.orientation,
-                self.space_width,
-                self.character_spacing,
-                self.margins,
-                self.fit,
-                self.output_mask,
-                self.word_split,
-                self.image_dir,
-                self.stroke_width,
-                self.stroke_fill,
-                self.image_mode,
-                self.output_bboxes,
+            FakeTextDataGenerator.generate_from_config(
+                index,
+                self.strings[index % len(self.strings)],
+                self.fonts[index % len(self.fonts)],
+                self.config,
+                derive_seed(self.seed, index) if self.seed is not None else None,
+                output=self.output,
             ),
-            self.orig_strings[(self.generated_count - 1) % len(self.orig_strings)]
+            self.orig_strings[index % len(self.orig_strings)]
             if self.rtl
-            else self.strings[(self.generated_count - 1) % len(self.strings)],
+            else self.strings[index % len(self.strings)],
         )
 
     def reshape_rtl(self, strings: list, rtl_shaper: ArabicReshaper):
@@ -1,13 +1,15 @@
 import os
 from typing import List, Tuple
 
+from trdg.generators.batch import StringBatchGenerator
 from trdg.generators.from_strings import GeneratorFromStrings
+from trdg.config import GenerationConfig
 from trdg.data_generator import FakeTextDataGenerator
 from trdg.string_generator import create_strings_from_wikipedia
 from trdg.utils import load_dict, load_fonts
 
 
-class GeneratorFromWikipedia:
+class GeneratorFromWikipedia(StringBatchGenerator):
     """Generator that uses sentences taken from random Wikipedia articles"""
 
     def __init__(
@@ -42,6 +44,11 @@ class GeneratorFromWikipedia:
         stroke_fill: str = "#282828",
         image_mode: str = "RGB",
         output_bboxes: int = 0,
+        seed: int = None,
+        shard_index: int = 0,
+        shard_count: int = 1,
+        config: GenerationConfig = None,
+        output: str = "pil",
     ):
         self.generated_count = 0
         self.count = count
@@ -81,6 +88,11 @@ class GeneratorFromWikipedia:
             stroke_fill,
             image_mode,
             output_bboxes,
+            seed=seed,
+            shard_index=shard_index,
+            shard_count=shard_count,
+            config=config,
+            output=output,
         )
 
     def __iter__(self):
@@ -93,9 +105,8 @@ class GeneratorFromWikipedia:
         return self.next()
 
     def next(self):
-        if self.generator.generated_count >= self.steps_until_regeneration:
-            self.generator.strings = create_strings_from_wikipedia(
+        return self.next_from_strings(
+            lambda: create_strings_from_wikipedia(
                 self.minimum_length, self.batch_size, self.language
             )
-            self.steps_until_regeneration += self.batch_size
-        return self.generator.next()
+        )
@@ -38,12 +38,12 @@ def download_model_weights() -> str:
     return cwd
 
 
-def _sample(e, mu1, mu2, std1, std2, rho):
+def _sample(e, mu1, mu2, std1, std2, rho, np_rng=np.random):
     cov = np.array([[std1 * std1, std1 * std2 * rho], [std1 * std2 * rho, std2 * std2]])
     mean = np.array([mu1, mu2])
 
-    x, y = np.random.multivariate_normal(mean, cov)
-    end = np.random.binomial(1, e)
+    x, y = np_rng.multivariate_normal(mean, cov)
+    end = np_rng.binomial(1, e)
     return np.array([x, y, end])
 
 
@@ -63,7 +63,7 @@ def _cumsum(points):
     return np.concatenate([sums, points[:, 2:]], axis=1)
 
 
-def _sample_text(sess, args_text, translation):
+def _sample_text(sess, args_text, translation, np_rng=np.random):
     # Original creator said it helps (https://github.com/Grzego/handwriting-generation/issues/3)
     args_text += " "
 
@@ -124,9 +124,9 @@ def _sample_text(sess, args_text, translation):
         window_data += [window[0, :]]
         kappa_data += [kappa[0, :]]
         # ---
-        g = np.random.choice(np.arange(pi.shape[1]), p=pi[0])
+        g = np_rng.choice(np.arange(pi.shape[1]), p=pi[0])
         coord = _sample(
-            e[0, 0], mu1[0, g], mu2[0, g], std1[0, g], std2[0, g], rho[0, g]
+            e[0, 0], mu1[0, g], mu2[0, g], std1[0, g], std2[0, g], rho[0, g], np_rng
         )
         coords += [coord]
         stroke_data += [
@@ -176,7 +176,18 @@ def _join_images(images):
     return compound_image
 
 
-def generate(text, text_color):
+def generate(text, text_color, rng=None):
+    """
+    Write the text with the RNN. Every random choice is drawn from rng, and
+    from a NumPy generator seeded by it, so that a seeded rng always gives
+    the same strokes. Without rng, the global random states are used.
+    """
+
+    if rng is None:
+        rng, np_rng = rnd, np.random
+    else:
+        np_rng = np.random.default_rng(rng.getrandbits(64))
+
     cd = download_model_weights()
     with open(
         os.path.join(cd, os.path.join("handwritten_model", "translation.pkl")), "rb"
@@ -197,14 +208,14 @@ def generate(text, text_color):
         c1, c2 = colors[0], colors[-1]
 
         color = "#{:02x}{:02x}{:02x}".format(
-            rnd.randint(min(c1[0], c2[0]), max(c1[0], c2[0])),
-            rnd.randint(min(c1[1], c2[1]), max(c1[1], c2[1])),
-            rnd.randint(min(c1[2], c2[2]), max(c1[2], c2[2])),
+            rng.randint(min(c1[0], c2[0]), max(c1[0], c2[0])),
+            rng.randint(min(c1[1], c2[1]), max(c1[1], c2[1])),
+            rng.randint(min(c1[2], c2[2]), max(c1[2], c2[2])),
         )
 
         for word in text.split(" "):
             _, window_data, kappa_data, stroke_data, coords = _sample_text(
-                sess, word, translation
+                sess, word, translation, np_rng
             )
 
             strokes = np.array(stroke_data)
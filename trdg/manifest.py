@@ -0,0 +1,185 @@
+"""
+Manifest of the samples written by a run, one JSON record per line
+"""
+
+import glob
+import json
+import os
+import re
+from typing import Iterator, List
+
+MANIFEST_NAME = "manifest"
+MANIFEST_EXTENSION = ".jsonl"
+
+# Number of records written to the manifest at once. A crash loses at most
+# the records of the current batch.
+MANIFEST_BATCH_SIZE = 100
+
+
+def shard_file_name(
+    name: str, extension: str, shard_index: int, shard_count: int
+) -> str:
+    """
+    Name of a per-shard output file, e.g. manifest-00003-of-00012.jsonl. Runs
+    that are not sharded keep the plain name (manifest.jsonl).
+    """
+
+    if shard_count <= 1:
+        return name + extension
+    return "{}-{:05d}-of-{:05d}{}".format(name, shard_index, shard_count, extension)
+
+
+def manifest_path(output_dir: str, shard_index: int = 0, shard_count: int = 1) -> str:
+    return os.path.join(
+        output_dir,
+        shard_file_name(MANIFEST_NAME, MANIFEST_EXTENSION, shard_index, shard_count),
+    )
+
+
+class ManifestWriter(object):
+    """
+    Appends the records of the completed samples to a manifest file, flushed
+    every batch_size records
+    """
+
+    def __init__(
+        self, path: str, append: bool = False, batch_size: int = MANIFEST_BATCH_SIZE
+    ):
+        self.path = path
+        self.batch_size = batch_size
+        self.lines = []
+        self.file = open(path, "a" if append else "w", encoding="utf8")
+        if append and self.file.tell() > 0:
+            # Terminate the truncated line a killed run may have left behind
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self.file.write("\n")
+
+    def write(self, record: dict) -> None:
+        self.lines.append(json.dumps(record, ensure_ascii=False) + "\n")
+        if len(self.lines) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        self.file.write("".join(self.lines))
+        self.file.flush()
+        self.lines = []
+
+    def close(self) -> None:
+        self.flush()
+        self.file.close()
+
+
+class LabelsWriter(object):
+    """
+    Writes the "file label" lines of the labels file in index order, from
+    the first index start. The samples complete out of order: the line of a
+    sample is held until those of the samples before it are written, so at
+    most as many lines as there are samples in flight wait. A sample given
+    again after it was written is skipped.
+    """
+
+    def __init__(self, path: str, start: int = 0):
+        self.path = path
+        self.next_index = start
+        self.pending = {}
+        self.file = open(path, "w", encoding="utf8")
+
+    def write(self, record: dict) -> None:
+        if record["index"] < self.next_index:
+            return
+        self.pending[record["index"]] = "{} {}\n".format(
+            record["file"], record["label"]
+        )
+        while self.next_index in self.pending:
+            self.file.write(self.pending.pop(self.next_index))
+            self.next_index += 1
+
+    def close(self) -> None:
+        # The lines held after a sample that was never written
+        for index in sorted(self.pending):
+            self.file.write(self.pending[index])
+        self.pending = {}
+        self.file.close()
+
+
+def read_manifest(path: str) -> Iterator[dict]:
+    """
+    Read the records of a manifest. A run that was killed can leave a
+    truncated last line behind, which is skipped.
+    """
+
+    with open(path, "r", encoding="utf8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def find_shard_files(output_dir: str, name: str, extension: str) -> List[str]:
+    """
+    Find the per-shard files of output_dir in shard order and check that no
+    shard is missing
+    """
+
+    pattern = re.compile(
+        re.escape(name) + r"-(\d{5})-of-(\d{5})" + re.escape(extension) + "$"
+    )
+    shards = {}
+    for path in glob.glob(os.path.join(output_dir, name + "-*-of-*" + extension)):
+        match = pattern.search(os.path.basename(path))
+        if match is not None:
+            shards[(int(match.group(1)), int(match.group(2)))] = path
+
+    shard_counts = set(shard_count for _, shard_count in shards)
+    if len(shard_counts) > 1:
+        raise ValueError(
+            "Found {} files for different shard counts: {}".format(
+                name, sorted(shard_counts)
+            )
+        )
+    for shard_count in shard_counts:
+        missing = [i for i in range(shard_count) if (i, shard_count) not in shards]
+        if len(missing) > 0:
+            raise ValueError(
+                "Missing {} file for shard(s) {} of {}".format(
+                    name, missing, shard_count
+                )
+            )
+
+    return [shards[key] for key in sorted(shards)]
+
+
+def merge_shard_files(output_dir: str, name: str, extension: str) -> int:
+    """
+    Concatenate the per-shard files of output_dir, in shard order, into a
+    single name + extension file. Returns the number of lines written.
+    """
+
+    shard_files = find_shard_files(output_dir, name, extension)
+    if len(shard_files) == 0:
+        return 0
+
+    line_count = 0
+    with open(os.path.join(output_dir, name + extension), "w", encoding="utf8") as out:
+        for path in shard_files:
+            with open(path, "r", encoding="utf8") as f:
+                for line in f:
+                    # Drop the truncated line a killed shard may have left
+                    if not line.endswith("\n"):
+                        continue
+                    out.write(line)
+                    line_count += 1
+
+    return line_count
+
+
+def merge_manifests(output_dir: str) -> int:
+    """
+    Join the manifests written by the shards of a run into manifest.jsonl.
+    Returns the number of samples of the merged manifest.
+    """
+
+    return merge_shard_files(output_dir, MANIFEST_NAME, MANIFEST_EXTENSION)
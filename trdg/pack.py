@@ -0,0 +1,207 @@
+"""
+Pack output: the samples are appended to one large file, and an index of
+their offsets gives random access to any of them without scanning the pack
+"""
+
+import io
+import mmap
+import os
+import struct
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+from PIL import Image
+
+from trdg.timing import StageTimings
+from trdg.writer import sample_members
+
+PACK_EXTENSION = ".pack"
+INDEX_EXTENSION = ".idx"
+ENTRIES_EXTENSION = ".entries"
+
+# Index file: magic and sample count, then one (sample index, offset, length)
+# entry per sample, sorted by sample index
+INDEX_MAGIC = b"TRDGIDX1"
+INDEX_HEADER = struct.Struct("<8sQ")
+INDEX_ENTRY_DTYPE = np.dtype("<u8")
+INDEX_ENTRY_FIELDS = 3
+INDEX_ENTRY = struct.Struct("<3Q")
+
+# Sample record of the pack: member count, then for every member the length
+# of its extension and content, followed by the extension and content
+MEMBER_COUNT = struct.Struct("<H")
+MEMBER_HEADER = struct.Struct("<BI")
+
+
+def index_path(pack_path: str) -> str:
+    return os.path.splitext(pack_path)[0] + INDEX_EXTENSION
+
+
+def entries_path(pack_path: str) -> str:
+    return os.path.splitext(pack_path)[0] + ENTRIES_EXTENSION
+
+
+def encode_sample(members: List[Tuple[str, bytes]]) -> bytes:
+    parts = [MEMBER_COUNT.pack(len(members))]
+    for extension, content in members:
+        extension = extension.encode("utf8")
+        parts.append(MEMBER_HEADER.pack(len(extension), len(content)))
+        parts.append(extension)
+        parts.append(content)
+    return b"".join(parts)
+
+
+def decode_sample(data: bytes) -> Dict[str, bytes]:
+    (member_count,) = MEMBER_COUNT.unpack_from(data, 0)
+    position = MEMBER_COUNT.size
+    members = {}
+    for _ in range(member_count):
+        extension_length, content_length = MEMBER_HEADER.unpack_from(data, position)
+        position += MEMBER_HEADER.size
+        extension = data[position : position + extension_length].decode("utf8")
+        position += extension_length
+        members[extension] = data[position : position + content_length]
+        position += content_length
+    return members
+
+
+class PackWriter(object):
+    """
+    Appends the samples to a pack file and writes its index when closed.
+    Every sample is stored with the same members as in a tar shard (jpg,
+    mask.png, boxes.txt, txt...), see PackReader. The index entries are
+    streamed to a side file as the samples are written, and sorted into the
+    index by write_index.
+
+    With timed set, the time spent writing every sample is counted as its
+    "write" stage in timings.
+    """
+
+    def __init__(self, path: str, timed: bool = False):
+        self.path = path
+        self.timings = StageTimings() if timed else None
+        self.file = open(path, "wb")
+        self.offset = 0
+        # (sample index, offset, length) entries, in the order of the pack
+        self.entries_file = open(entries_path(path), "wb")
+
+    def write(self, files: List[Tuple[str, bytes]], record: dict) -> None:
+        start = time.perf_counter()
+        data = encode_sample(sample_members(files, record))
+        self.file.write(data)
+        if self.timings is not None:
+            self.timings.add({"write": time.perf_counter() - start})
+        self.entries_file.write(
+            INDEX_ENTRY.pack(record["index"], self.offset, len(data))
+        )
+
+        # Where the sample is stored, for the manifest
+        record.update(pack=os.path.basename(self.path), offset=self.offset)
+        self.offset += len(data)
+
+    def close(self) -> None:
+        self.file.close()
+        self.entries_file.close()
+        write_index(self.path)
+
+
+def write_index(pack_path: str) -> int:
+    """
+    Sort the entries written next to a pack into its index, then remove
+    them. This also gives an index to the pack of a run that was killed,
+    without the samples that were not completely written. Returns the
+    number of samples of the index.
+    """
+
+    pack_size = os.path.getsize(pack_path)
+    entries = np.fromfile(entries_path(pack_path), dtype=INDEX_ENTRY_DTYPE)
+    entries = entries[: len(entries) // INDEX_ENTRY_FIELDS * INDEX_ENTRY_FIELDS]
+    entries = entries.reshape(-1, INDEX_ENTRY_FIELDS)
+    entries = entries[entries[:, 1] + entries[:, 2] <= pack_size]
+    # The workers return the samples out of order
+    entries = entries[np.argsort(entries[:, 0], kind="stable")]
+    with open(index_path(pack_path), "wb") as f:
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, len(entries)))
+        f.write(entries.tobytes())
+    os.remove(entries_path(pack_path))
+    return len(entries)
+
+
+class PackReader(object):
+    """
+    Random access to the samples of a pack. The pack and its index are
+    memory mapped, reader[i] returns the members of the i-th sample (in
+    sample index order) as a dict of extension to content.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.index_map = self._map(index_path(path))
+        magic, count = INDEX_HEADER.unpack_from(self.index_map, 0)
+        if magic != INDEX_MAGIC:
+            raise ValueError("{} is not a pack index".format(index_path(path)))
+        self.entries = np.frombuffer(
+            self.index_map,
+            dtype=INDEX_ENTRY_DTYPE,
+            count=count * INDEX_ENTRY_FIELDS,
+            offset=INDEX_HEADER.size,
+        ).reshape(-1, INDEX_ENTRY_FIELDS)
+        self.pack_map = self._map(path)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __getitem__(self, i: int) -> Dict[str, bytes]:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("pack index out of range")
+        _, offset, length = (int(v) for v in self.entries[i])
+        return decode_sample(self.pack_map[offset : offset + length])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def sample_index(self, i: int) -> int:
+        """
+        Index the i-th sample of the pack had in the run (the pack of a shard
+        starts at the first index of the shard)
+        """
+
+        return int(self.entries[i][0])
+
+    def find(self, sample_index: int) -> int:
+        """
+        Position in the pack of the sample that had sample_index in the run
+        """
+
+        i = int(np.searchsorted(self.entries[:, 0], sample_index))
+        if i == len(self) or int(self.entries[i][0]) != sample_index:
+            raise KeyError(sample_index)
+        return i
+
+    def image(self, i: int) -> Image:
+        # The image is always the first member of a sample
+        content = next(iter(self[i].values()))
+        return Image.open(io.BytesIO(content))
+
+    def label(self, i: int) -> str:
+        return self[i]["txt"].decode("utf8")
+
+    def close(self) -> None:
+        # The index map cannot be closed while entries still points into it
+        self.entries = None
+        for m in (self.index_map, self.pack_map):
+            if isinstance(m, mmap.mmap):
+                m.close()
+
+    @staticmethod
+    def _map(path: str):
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b""
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
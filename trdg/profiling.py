@@ -0,0 +1,63 @@
+"""
+cProfile of the pool workers: every worker dumps its own profile when it
+exits, the dumps are then merged into one report
+"""
+
+import cProfile
+import glob
+import os
+import pstats
+import sys
+from multiprocessing.util import Finalize
+from typing import Optional
+
+PROFILE_PATTERN = "worker-*.pstats"
+MERGED_PROFILE = "merged.pstats"
+
+
+def prepare_profile_dir(profile_dir: str) -> None:
+    """
+    Create profile_dir, without the worker profiles of a previous run
+    """
+
+    os.makedirs(profile_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(profile_dir, PROFILE_PATTERN)):
+        os.remove(path)
+
+
+def start_worker_profile(profile_dir: str) -> None:
+    """
+    Profile the current worker process until it exits. The profile is only
+    dumped on a clean exit, the pool has to be closed and joined rather than
+    terminated.
+    """
+
+    profiler = cProfile.Profile()
+    path = os.path.join(profile_dir, "worker-{}.pstats".format(os.getpid()))
+    # Run by the worker on exit, before the interpreter shuts down
+    Finalize(None, _dump_profile, args=(profiler, path), exitpriority=10)
+    profiler.enable()
+
+
+def merge_profiles(
+    profile_dir: str, limit: Optional[int] = 30, stream=None
+) -> pstats.Stats:
+    """
+    Merge the worker profiles of profile_dir into MERGED_PROFILE and print
+    its limit most expensive functions by cumulative time, or all of them
+    when limit is None
+    """
+
+    paths = sorted(glob.glob(os.path.join(profile_dir, PROFILE_PATTERN)))
+    if not paths:
+        raise ValueError("No worker profile in {}".format(profile_dir))
+
+    stats = pstats.Stats(*paths, stream=stream if stream is not None else sys.stdout)
+    stats.dump_stats(os.path.join(profile_dir, MERGED_PROFILE))
+    stats.strip_dirs().sort_stats("cumulative").print_stats(limit)
+    return stats
+
+
+def _dump_profile(profiler: cProfile.Profile, path: str) -> None:
+    profiler.disable()
+    profiler.dump_stats(path)
@@ -8,18 +8,75 @@ sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 import random as rnd
 import string
 import sys
+from collections import Counter, namedtuple
+from functools import partial
 from multiprocessing import Pool
+from typing import Iterator, List, Tuple
 
 from tqdm import tqdm
 
-from trdg.data_generator import FakeTextDataGenerator
+from trdg import background_generator
+from trdg.computer_text_generator import glyph_atlas, glyph_metrics
+from trdg.config import GenerationConfig
+from trdg.data_generator import (
+    FakeTextDataGenerator,
+    contrast_stats,
+    format_contrast_stats,
+)
 from trdg.string_generator import (
     create_strings_from_dict,
-    create_strings_from_file,
     create_strings_from_wikipedia,
     create_strings_randomly,
+    iterate_strings_from_file,
+)
+from trdg.manifest import (
+    LabelsWriter,
+    ManifestWriter,
+    manifest_path,
+    merge_manifests,
+    merge_shard_files,
+    read_manifest,
+    shard_file_name,
+)
+from trdg.pack import PACK_EXTENSION, PackWriter
+from trdg.profiling import (
+    merge_profiles,
+    prepare_profile_dir,
+    start_worker_profile,
+)
+from trdg.timing import StageTimer, StageTimings, format_timings
+from trdg.utils import derive_seed, load_dict, load_fonts, shard_range
+from trdg.writer import (
+    InFlightLimit,
+    SampleWriter,
+    TarShardWriter,
+    format_writer_stats,
+)
+
+# Number of strings created at once when streaming them to the workers
+STRINGS_BATCH_SIZE = 1000
+
+# Upper bound of the automatically computed --chunksize
+MAX_CHUNKSIZE = 256
+
+# Frozen, per-run part of the generation arguments. Sent once to every worker
+# so that the tasks only have to carry the per-sample fields.
+RunConfig = namedtuple(
+    "RunConfig",
+    [
+        "seed",
+        "fonts",
+        "config",
+        "return_files",
+        "metadata",
+        "timings",
+        "profile_dir",
+        "alphabet",
+    ],
 )
-from trdg.utils import load_dict, load_fonts
+
+# Installed in each worker process by init_worker
+_run_config = None
 
 
 def margins(margin):
@@ -62,7 +119,6 @@ def parse_arguments():
         type=int,
         nargs="?",
         help="The number of images to be created.",
-        required=True,
     )
     parser.add_argument(
         "-rs",
@@ -196,6 +252,13 @@ def parse_arguments():
         help="Define if the generator will return masks for the text",
         default=0,
     )
+    parser.add_argument(
+        "-mt",
+        "--mask_type",
+        type=int,
+        help="Define how the masks are encoded. 0: RGB image where the i-th character is colored ((i + 1) // (255 * 255), (i + 1) // 255, (i + 1) % 255) (Default), 1: 16 bit PNG label map where the pixels of the i-th character are i + 1, 2: the same label map as a .npy file. The bounding boxes are also faster to extract from a label map",
+        default=0,
+    )
     parser.add_argument(
         "-obb",
         "--output_bboxes",
@@ -341,7 +404,482 @@ def parse_arguments():
         help="Define the image mode to be used. RGB is default, L means 8-bit grayscale images, 1 means 1-bit binary images stored with one pixel per byte, etc.",
         default="RGB",
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "-chs",
+        "--chunksize",
+        type=int,
+        nargs="?",
+        help="Define how many consecutive samples are sent to a worker at once. Larger chunks lower the scheduling overhead per sample. If not set it is computed from the count and the number of threads",
+        default=0,
+    )
+    parser.add_argument(
+        "-sd",
+        "--seed",
+        type=int,
+        nargs="?",
+        help="Define the seed of the run. Every sample is generated from (seed, index) so a given seed always produces the same images, whatever the number of threads. Random if not set",
+        default=None,
+    )
+    parser.add_argument(
+        "-si",
+        "--shard_index",
+        type=int,
+        nargs="?",
+        help="Define which shard of the dataset this process generates. Shards are contiguous ranges of indices, use the same --seed and --count on every shard",
+        default=0,
+    )
+    parser.add_argument(
+        "-sc",
+        "--shard_count",
+        type=int,
+        nargs="?",
+        help="Define in how many shards the dataset is split. Each shard writes its own manifest",
+        default=1,
+    )
+    parser.add_argument(
+        "-mm",
+        "--merge_manifests",
+        action="store_true",
+        help="Merge the manifests (and labels) written by the shards in --output_dir, then exit",
+        default=False,
+    )
+    parser.add_argument(
+        "-re",
+        "--resume",
+        action="store_true",
+        help="Only generate the samples that are missing from --output_dir, according to the manifest of a previous run or, failing that, to the files found (a sample needs all its files, and is generated again with --manifest). Requires the --seed and arguments of that run",
+        default=False,
+    )
+    parser.add_argument(
+        "-wt",
+        "--writer_threads",
+        type=int,
+        nargs="?",
+        help="Define the number of threads writing the files. When set, the workers only render and encode the samples, which are written by these threads. Only with --output_format files",
+        default=0,
+    )
+    parser.add_argument(
+        "-wq",
+        "--writer_queue_size",
+        type=int,
+        nargs="?",
+        help="Define how many encoded samples can wait for the writer threads",
+        default=256,
+    )
+    parser.add_argument(
+        "-of",
+        "--output_format",
+        type=str,
+        nargs="?",
+        help="Define how the samples are stored: files writes one file per image (and mask, boxes), tar streams them into WebDataset-style tar shards, pack appends them to a single file with an offset index for random access (see trdg.pack.PackReader)",
+        choices=["files", "tar", "pack"],
+        default="files",
+    )
+    parser.add_argument(
+        "-ss",
+        "--samples_per_shard",
+        type=int,
+        nargs="?",
+        help="Define the number of samples in each tar shard when --output_format is tar",
+        default=1000,
+    )
+    parser.add_argument(
+        "-mf",
+        "--manifest",
+        action="store_true",
+        help="Write manifest.jsonl, with one record per written sample holding its file, label, font, size, skew, blur, background and bounding boxes",
+        default=False,
+    )
+    parser.add_argument(
+        "-fx",
+        "--fast_transform",
+        action="store_true",
+        help="Rotate and resize the text in a single affine warp instead of two passes. Faster, but the image is interpolated bilinearly instead of with LANCZOS. Ignored when a distorsion is applied",
+        default=False,
+    )
+    parser.add_argument(
+        "-ga",
+        "--glyph_atlas",
+        action="store_true",
+        help="Rasterize every character of a font once and composite the text from these bitmaps with NumPy instead of drawing it character by character. Only used for horizontal text without --word_split",
+        default=False,
+    )
+    parser.add_argument(
+        "-wl",
+        "--whole_line",
+        action="store_true",
+        help="Draw every line of horizontal text at once instead of character by character, which keeps the kerning and ligatures of the font. Slower, and cannot be used with --output_mask or --output_bboxes, the manifest records have no bounding boxes. Ignored with a --character_spacing, a --space_width, --glyph_atlas and for right-to-left text",
+        default=False,
+    )
+    parser.add_argument(
+        "-wr",
+        "--wrap",
+        action="store_true",
+        help="Break the horizontal text that is wider than --width into several lines, e.g. for paragraphs read from a file. The image is then as high as --format per line",
+        default=False,
+    )
+    parser.add_argument(
+        "-ti",
+        "--timings",
+        action="store_true",
+        help="Time the stages of every sample (render, rotate, background, blur, encode, write...), including the writes of --writer_threads and of the tar and pack outputs, and print their p50, p95 and total time at the end of the run",
+        default=False,
+    )
+    parser.add_argument(
+        "-tj",
+        "--timings_json",
+        type=str,
+        nargs="?",
+        help="Time the stages of every sample like --timings, and also write the table to this JSON file",
+        default=None,
+    )
+    parser.add_argument(
+        "-pf",
+        "--profile",
+        action="store_true",
+        help="Profile every worker with cProfile. The profiles are written to the profile folder of the output directory, merged into merged.pstats, and the most expensive functions are printed by cumulative time",
+        default=False,
+    )
+    args = parser.parse_args()
+    if args.count is None and not args.merge_manifests:
+        parser.error("the following arguments are required: -c/--count")
+    if args.resume and args.seed is None:
+        parser.error("--resume requires the --seed of the run to resume")
+    if args.whole_line and (args.output_mask or args.output_bboxes):
+        parser.error(
+            "--whole_line cannot be used with --output_mask or --output_bboxes"
+        )
+    if args.use_wikipedia and (args.resume or args.shard_count > 1):
+        # The strings fetched from Wikipedia cannot be drawn again
+        parser.error("--use_wikipedia cannot be used with --resume or --shard_count")
+    if args.writer_threads > 0 and args.output_format != "files":
+        # The tar and pack outputs are written by the main process
+        parser.error(
+            "--writer_threads is not supported with --output_format {}".format(
+                args.output_format
+            )
+        )
+    if args.resume and args.output_format != "files":
+        parser.error(
+            "--resume is not supported with --output_format {}".format(
+                args.output_format
+            )
+        )
+    return args
+
+
+def iterate_strings(args, lang_dict: List[str], rng: rnd.Random) -> Iterator[str]:
+    """
+    Lazily create the synthetic sentences (or words), STRINGS_BATCH_SIZE at a
+    time, so that memory usage does not grow with --count
+    """
+
+    if args.input_file != "":
+        strings = iterate_strings_from_file(args.input_file, args.count)
+    else:
+        strings = (
+            s
+            for start in range(0, args.count, STRINGS_BATCH_SIZE)
+            for s in _create_strings_batch(
+                args, lang_dict, min(STRINGS_BATCH_SIZE, args.count - start), rng
+            )
+        )
+
+    if args.language == "ar":
+        from arabic_reshaper import ArabicReshaper
+        from bidi.algorithm import get_display
+
+        arabic_reshaper = ArabicReshaper()
+        strings = (
+            " ".join(
+                [get_display(arabic_reshaper.reshape(w)) for w in s.split(" ")[::-1]]
+            )
+            for s in strings
+        )
+    if args.case == "upper":
+        strings = (x.upper() for x in strings)
+    if args.case == "lower":
+        strings = (x.lower() for x in strings)
+
+    return strings
+
+
+def _create_strings_batch(
+    args, lang_dict: List[str], count: int, rng: rnd.Random
+) -> List[str]:
+    if args.use_wikipedia:
+        return create_strings_from_wikipedia(args.length, count, args.language)
+    elif args.random_sequences:
+        return create_strings_randomly(
+            args.length,
+            args.random,
+            count,
+            args.include_letters,
+            args.include_numbers,
+            args.include_symbols,
+            args.language,
+            rng,
+        )
+    else:
+        return create_strings_from_dict(args.length, args.random, count, lang_dict, rng)
+
+
+def iterate_tasks(
+    args,
+    strings: Iterator[str],
+    fonts: List[str],
+    rng: rnd.Random,
+    start: int = 0,
+    end: int = None,
+    completed: bytearray = None,
+) -> Iterator[Tuple[int, str, int]]:
+    """
+    Yield one (index, text, font_id) task per sample with start <= index < end,
+    skipping the samples flagged in completed. Everything else is constant for
+    the run and installed once per worker by init_worker.
+    """
+
+    for i, text in enumerate(strings):
+        # The strings and fonts of the previous shards are still drawn so
+        # that every shard sees the same logical dataset
+        font_id = rng.randrange(0, len(fonts))
+        if i < start:
+            continue
+        if end is not None and i >= end:
+            break
+        if completed is not None and completed[i - start]:
+            continue
+        yield (i, text, font_id)
+
+
+def find_completed_samples(
+    args,
+    lang_dict: List[str],
+    fonts: List[str],
+    start: int,
+    end: int,
+    manifest: ManifestWriter,
+) -> bytearray:
+    """
+    Flag the samples of [start, end) written by a previous run. They are read
+    from its manifest, and the samples that are not in it but whose files are
+    all in --output_dir are added to it. With --manifest, these are generated
+    again instead, their records would lack the metadata of the others.
+    """
+
+    completed = bytearray(end - start)
+    if os.path.exists(manifest.path):
+        for record in read_manifest(manifest.path):
+            if start <= record["index"] < end:
+                completed[record["index"] - start] = 1
+    if args.manifest:
+        return completed
+
+    rng = rnd.Random(args.seed)
+    for i, text, _ in iterate_tasks(
+        args,
+        iterate_strings(args, lang_dict, rng),
+        fonts,
+        rng,
+        start,
+        end,
+        completed=completed,
+    ):
+        label = text
+        if args.space_width == 0:
+            label = label.replace(" ", "")
+        file_names = FakeTextDataGenerator.get_file_names(
+            FakeTextDataGenerator.get_name(i, label, args.name_format),
+            args.extension,
+            args.output_mask,
+            args.output_bboxes,
+            args.mask_type,
+        )
+        if all(os.path.exists(os.path.join(args.output_dir, f)) for f in file_names):
+            completed[i - start] = 1
+            manifest.write({"index": i, "file": file_names[0], "label": label})
+
+    return completed
+
+
+def rebuild_labels_file(manifest_file: str, labels_path: str, start: int = 0) -> None:
+    """
+    Write the labels file of a resumed run from its manifest, one line per
+    sample in index order, so that it lists the samples of the previous run
+    once and those found in --output_dir too
+    """
+
+    labels = LabelsWriter(labels_path, start)
+    for record in sorted(read_manifest(manifest_file), key=lambda r: r["index"]):
+        labels.write(record)
+    labels.close()
+
+
+def compute_chunksize(count: int, thread_count: int) -> int:
+    """
+    Same heuristic as Pool.map (about four chunks per worker), but bounded so
+    that the progress bar keeps moving and the workers stay balanced on very
+    large runs
+    """
+
+    return max(1, min(MAX_CHUNKSIZE, count // (max(thread_count, 1) * 4)))
+
+
+def create_run_config(args, fonts: List[str], lang_dict: List[str] = ()) -> RunConfig:
+    """
+    Gather the arguments of FakeTextDataGenerator.generate that do not change
+    from one sample to the next
+    """
+
+    return RunConfig(
+        seed=args.seed,
+        fonts=tuple(fonts),
+        config=GenerationConfig(
+            out_dir=args.output_dir,
+            size=args.format,
+            extension=args.extension,
+            skewing_angle=args.skew_angle,
+            random_skew=args.random_skew,
+            blur=args.blur,
+            random_blur=args.random_blur,
+            background_type=args.background,
+            distorsion_type=args.distorsion,
+            distorsion_orientation=args.distorsion_orientation,
+            is_handwritten=args.handwritten,
+            name_format=args.name_format,
+            width=args.width,
+            alignment=args.alignment,
+            text_color=args.text_color,
+            orientation=args.orientation,
+            space_width=args.space_width,
+            character_spacing=args.character_spacing,
+            margins=tuple(args.margins),
+            fit=args.fit,
+            output_mask=args.output_mask,
+            word_split=args.word_split,
+            image_dir=args.image_dir,
+            stroke_width=args.stroke_width,
+            stroke_fill=args.stroke_fill,
+            image_mode=args.image_mode,
+            output_bboxes=args.output_bboxes,
+            fast_transform=args.fast_transform,
+            glyph_atlas=args.glyph_atlas,
+            wrap=args.wrap,
+            mask_type=args.mask_type,
+            whole_line=args.whole_line,
+        ),
+        return_files=args.writer_threads > 0 or args.output_format != "files",
+        metadata=args.manifest,
+        timings=args.timings or args.timings_json is not None,
+        profile_dir=profile_dir(args) if args.profile else None,
+        alphabet=dict_alphabet(args, lang_dict),
+    )
+
+
+def dict_alphabet(args, lang_dict: List[str]) -> str:
+    """
+    Characters of the strings when they are drawn from the dictionary
+    """
+
+    if args.input_file or args.use_wikipedia or args.random_sequences:
+        return ""
+    alphabet = set("".join(lang_dict))
+    if args.case == "upper":
+        alphabet = {c.upper() for c in alphabet}
+    if args.case == "lower":
+        alphabet = {c.lower() for c in alphabet}
+    return "".join(sorted(alphabet))
+
+
+def profile_dir(args) -> str:
+    return os.path.join(
+        args.output_dir,
+        shard_file_name("profile", "", args.shard_index, args.shard_count),
+    )
+
+
+def init_worker(run_config: RunConfig) -> None:
+    """
+    Pool initializer: install the run configuration in the worker process
+    and preload the assets shared by every sample
+    """
+
+    global _run_config
+    _run_config = run_config
+
+    if run_config.config.background_type == 3:
+        background_generator.preload_images(run_config.config.image_dir)
+
+    if run_config.profile_dir is not None:
+        start_worker_profile(run_config.profile_dir)
+
+    # The sizes of the dictionary's characters are measured once per font,
+    # and rasterized once with --glyph_atlas
+    config = run_config.config
+    if not config.is_handwritten:
+        for font in run_config.fonts:
+            glyph_metrics(font, config.size).preload(run_config.alphabet)
+            if config.glyph_atlas and config.orientation == 0:
+                glyph_atlas(font, config.size, config.stroke_width).preload(
+                    run_config.alphabet
+                )
+
+
+def generate_task(task: Tuple[int, str, int]):
+    """
+    Generate the sample described by a task yielded by iterate_tasks
+    """
+
+    index, text, font_id = task
+
+    metadata = {} if _run_config.metadata else None
+    timer = StageTimer() if _run_config.timings else None
+    # Only this task's contrast fixes are sent back, and only when there are
+    # any, the samples are counted by the main process
+    contrast_stats.clear()
+    result = FakeTextDataGenerator.generate_from_config(
+        index,
+        text,
+        _run_config.fonts[font_id],
+        _run_config.config,
+        seed=derive_seed(_run_config.seed, index),
+        return_files=_run_config.return_files,
+        metadata=metadata,
+        timer=timer,
+    )
+    del contrast_stats["samples"]
+    contrast = dict(contrast_stats) if contrast_stats else None
+    durations = timer.durations if timer is not None else None
+
+    # With a writer stage, the encoded files are sent back instead of written
+    image_name, files = result if _run_config.return_files else (result, None)
+
+    label = text
+    if _run_config.config.space_width == 0:
+        label = label.replace(" ", "")
+    record = {"index": index, "file": image_name, "label": label}
+    if metadata is not None:
+        record.update(metadata)
+    return record, files, contrast, durations
+
+
+def write_record(
+    record: dict,
+    manifest: ManifestWriter = None,
+    labels: LabelsWriter = None,
+    in_flight: InFlightLimit = None,
+) -> None:
+    """
+    Log a sample once its files are written, so that the manifest and labels
+    never list a sample that is not on disk, and free its in_flight slot
+    """
+
+    if manifest is not None:
+        manifest.write(record)
+    if labels is not None:
+        labels.write(record)
+    if in_flight is not None:
+        in_flight.release()
 
 
 def main():
@@ -352,6 +890,16 @@ def main():
     # Argument parsing
     args = parse_arguments()
 
+    if args.merge_manifests:
+        sample_count = merge_manifests(args.output_dir)
+        merge_shard_files(args.output_dir, "labels", ".txt")
+        print(
+            "Merged {} samples into {}".format(
+                sample_count, manifest_path(args.output_dir)
+            )
+        )
+        return
+
     # Create the directory if it does not exist.
     try:
         os.makedirs(args.output_dir)
@@ -387,106 +935,159 @@ def main():
     else:
         fonts = load_fonts(args.language)
 
-    # Creating synthetic sentences (or word)
-    strings = []
+    if args.seed is None:
+        args.seed = rnd.randrange(2**32)
+    # The strings and font choices are drawn in this process, sample by sample
+    rng = rnd.Random(args.seed)
 
-    if args.use_wikipedia:
-        strings = create_strings_from_wikipedia(args.length, args.count, args.language)
-    elif args.input_file != "":
-        strings = create_strings_from_file(args.input_file, args.count)
-    elif args.random_sequences:
-        strings = create_strings_randomly(
-            args.length,
-            args.random,
-            args.count,
-            args.include_letters,
-            args.include_numbers,
-            args.include_symbols,
-            args.language,
+    # Set a name format compatible with special characters automatically if they are used
+    if args.random_sequences and (
+        args.include_symbols
+        or not any((args.include_letters, args.include_numbers, args.include_symbols))
+    ):
+        args.name_format = 2
+
+    start, end = shard_range(args.count, args.shard_index, args.shard_count)
+
+    labels = None
+    labels_path = os.path.join(
+        args.output_dir,
+        shard_file_name("labels", ".txt", args.shard_index, args.shard_count),
+    )
+    if args.name_format == 2 and not args.resume:
+        # Create file with filename-to-label connections
+        labels = LabelsWriter(labels_path, start)
+
+    # Each shard keeps track of the samples it wrote, see --merge_manifests
+    manifest = None
+    if args.manifest or args.shard_count > 1 or args.resume:
+        manifest = ManifestWriter(
+            manifest_path(args.output_dir, args.shard_index, args.shard_count),
+            append=args.resume,
         )
-        # Set a name format compatible with special characters automatically if they are used
-        if args.include_symbols or True not in (
-            args.include_letters,
-            args.include_numbers,
-            args.include_symbols,
-        ):
-            args.name_format = 2
-    else:
-        strings = create_strings_from_dict(
-            args.length, args.random, args.count, lang_dict
+
+    completed = None
+    remaining = end - start
+    if args.resume:
+        completed = find_completed_samples(args, lang_dict, fonts, start, end, manifest)
+        remaining -= sum(completed)
+        print(
+            "Resuming, {} of {} samples left to generate".format(remaining, end - start)
         )
 
-    if args.language == "ar":
-        from arabic_reshaper import ArabicReshaper
-        from bidi.algorithm import get_display
+    chunksize = args.chunksize
+    if chunksize <= 0:
+        chunksize = compute_chunksize(remaining, args.thread_count)
 
-        arabic_reshaper = ArabicReshaper()
-        strings = [
-            " ".join(
-                [get_display(arabic_reshaper.reshape(w)) for w in s.split(" ")[::-1]]
-            )
-            for s in strings
-        ]
-    if args.case == "upper":
-        strings = [x.upper() for x in strings]
-    if args.case == "lower":
-        strings = [x.lower() for x in strings]
+    # Every chunk of the workers can be done while the writer queue is full,
+    # the samples past that wait to be handed to the pool
+    in_flight = InFlightLimit(
+        args.writer_queue_size + max(args.thread_count, 1) * chunksize
+    )
+
+    # The writer stages time their writes, the workers do when they write
+    timed = args.timings or args.timings_json is not None
+    writer = None
+    if args.output_format == "tar":
+        writer = TarShardWriter(
+            args.output_dir,
+            args.samples_per_shard,
+            shard_file_name("samples", "", args.shard_index, args.shard_count),
+            timed=timed,
+        )
+    elif args.output_format == "pack":
+        writer = PackWriter(
+            os.path.join(
+                args.output_dir,
+                shard_file_name(
+                    "samples", PACK_EXTENSION, args.shard_index, args.shard_count
+                ),
+            ),
+            timed=timed,
+        )
+    elif args.writer_threads > 0:
+        writer = SampleWriter(
+            args.output_dir,
+            args.writer_threads,
+            args.writer_queue_size,
+            partial(
+                write_record,
+                manifest=manifest,
+                labels=labels,
+                in_flight=in_flight,
+            ),
+            timed=timed,
+        )
 
-    string_count = len(strings)
+    run_config = create_run_config(args, fonts, lang_dict)
+    if run_config.profile_dir is not None:
+        prepare_profile_dir(run_config.profile_dir)
 
-    p = Pool(args.thread_count)
-    for _ in tqdm(
+    p = Pool(
+        args.thread_count,
+        initializer=init_worker,
+        initargs=(run_config,),
+    )
+    contrast = Counter()
+    timings = StageTimings()
+    for record, files, sample_contrast, durations in tqdm(
         p.imap_unordered(
-            FakeTextDataGenerator.generate_from_tuple,
-            zip(
-                [i for i in range(0, string_count)],
-                strings,
-                [fonts[rnd.randrange(0, len(fonts))] for _ in range(0, string_count)],
-                [args.output_dir] * string_count,
-                [args.format] * string_count,
-                [args.extension] * string_count,
-                [args.skew_angle] * string_count,
-                [args.random_skew] * string_count,
-                [args.blur] * string_count,
-                [args.random_blur] * string_count,
-                [args.background] * string_count,
-                [args.distorsion] * string_count,
-                [args.distorsion_orientation] * string_count,
-                [args.handwritten] * string_count,
-                [args.name_format] * string_count,
-                [args.width] * string_count,
-                [args.alignment] * string_count,
-                [args.text_color] * string_count,
-                [args.orientation] * string_count,
-                [args.space_width] * string_count,
-                [args.character_spacing] * string_count,
-                [args.margins] * string_count,
-                [args.fit] * string_count,
-                [args.output_mask] * string_count,
-                [args.word_split] * string_count,
-                [args.image_dir] * string_count,
-                [args.stroke_width] * string_count,
-                [args.stroke_fill] * string_count,
-                [args.image_mode] * string_count,
-                [args.output_bboxes] * string_count,
+            generate_task,
+            in_flight.limit(
+                iterate_tasks(
+                    args,
+                    iterate_strings(args, lang_dict, rng),
+                    fonts,
+                    rng,
+                    start,
+                    end,
+                    completed,
+                )
             ),
+            chunksize=chunksize,
         ),
-        total=args.count,
+        total=remaining,
     ):
-        pass
-    p.terminate()
+        contrast["samples"] += 1
+        if sample_contrast is not None:
+            contrast.update(sample_contrast)
+        if durations is not None:
+            timings.add(durations)
+        if isinstance(writer, SampleWriter):
+            # Logged by the writer threads once the files are written
+            writer.write(files, record)
+            continue
+        if writer is not None:
+            writer.write(files, record)
+        write_record(record, manifest, labels, in_flight)
+    # Closed rather than terminated, so that the workers exit cleanly and
+    # dump their profiles
+    p.close()
+    p.join()
 
-    if args.name_format == 2:
-        # Create file with filename-to-label connections
-        with open(
-            os.path.join(args.output_dir, "labels.txt"), "w", encoding="utf8"
-        ) as f:
-            for i in range(string_count):
-                file_name = str(i) + "." + args.extension
-                label = strings[i]
-                if args.space_width == 0:
-                    label = label.replace(" ", "")
-                f.write("{} {}\n".format(file_name, label))
+    if writer is not None:
+        writer.close()
+        if isinstance(writer, SampleWriter):
+            print(format_writer_stats(writer.stats()))
+        if writer.timings is not None:
+            timings.merge(writer.timings)
+
+    print(format_contrast_stats(contrast))
+    if timings.stages:
+        print(format_timings(timings))
+        if args.timings_json is not None:
+            timings.write_json(args.timings_json)
+    if run_config.profile_dir is not None:
+        merge_profiles(run_config.profile_dir)
+
+    if manifest is not None:
+        manifest.close()
+
+    if labels is not None:
+        labels.close()
+    elif args.name_format == 2 and args.resume:
+        # The labels of a resumed run are written once it is complete
+        rebuild_labels_file(manifest.path, labels_path, start)
 
 
 if __name__ == "__main__":
@@ -1,6 +1,6 @@
 import random as rnd
 import string
-from typing import List
+from typing import Iterator, List
 
 import wikipedia
 
@@ -10,34 +10,44 @@ def create_strings_from_file(filename: str, count: int) -> List[str]:
     Create all strings by reading lines in specified files
     """
 
-    strings = []
+    return list(iterate_strings_from_file(filename, count))
+
+
+def iterate_strings_from_file(filename: str, count: int) -> Iterator[str]:
+    """
+    Same as create_strings_from_file, but yields the strings one at a time
+    instead of building a list of length count
+    """
 
     with open(filename, "r", encoding="utf8") as f:
         lines = [l[0:200] for l in f.read().splitlines() if len(l) > 0]
-        if len(lines) == 0:
-            raise Exception("No lines could be read in file")
-        while len(strings) < count:
-            if len(lines) >= count - len(strings):
-                strings.extend(lines[0 : count - len(strings)])
-            else:
-                strings.extend(lines)
+    if len(lines) == 0:
+        raise Exception("No lines could be read in file")
 
-    return strings
+    for i in range(count):
+        yield lines[i % len(lines)]
 
 
 def create_strings_from_dict(
-    length: int, allow_variable: bool, count: int, lang_dict: List[str]
+    length: int,
+    allow_variable: bool,
+    count: int,
+    lang_dict: List[str],
+    rng: rnd.Random = None,
 ) -> List[str]:
     """
     Create all strings by picking X random word in the dictionary
     """
 
+    if rng is None:
+        rng = rnd
+
     dict_len = len(lang_dict)
     strings = []
     for _ in range(0, count):
         current_string = ""
-        for _ in range(0, rnd.randint(1, length) if allow_variable else length):
-            current_string += lang_dict[rnd.randrange(dict_len)]
+        for _ in range(0, rng.randint(1, length) if allow_variable else length):
+            current_string += lang_dict[rng.randrange(dict_len)]
             current_string += " "
         strings.append(current_string[:-1])
     return strings
@@ -80,11 +90,15 @@ def create_strings_randomly(
     num: bool,
     sym: bool,
     lang: str,
+    rng: rnd.Random = None,
 ) -> List[str]:
     """
     Create all strings by randomly sampling from a pool of characters.
     """
 
+    if rng is None:
+        rng = rnd
+
     # If none specified, use all three
     if True not in (let, num, sym):
         let, num, sym = True, True, True
@@ -132,9 +146,9 @@ def create_strings_randomly(
     strings = []
     for _ in range(0, count):
         current_string = ""
-        for _ in range(0, rnd.randint(1, length) if allow_variable else length):
-            seq_len = rnd.randint(min_seq_len, max_seq_len)
-            current_string += "".join([rnd.choice(pool) for _ in range(seq_len)])
+        for _ in range(0, rng.randint(1, length) if allow_variable else length):
+            seq_len = rng.randint(min_seq_len, max_seq_len)
+            current_string += "".join([rng.choice(pool) for _ in range(seq_len)])
             current_string += " "
         strings.append(current_string[:-1])
     return strings
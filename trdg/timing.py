@@ -0,0 +1,190 @@
+"""
+Optional timers of the stages of FakeTextDataGenerator.generate_from_config,
+and the histograms that aggregate them over a run
+"""
+
+import json
+import math
+import time
+from typing import Dict
+
+# Stages of a sample, in the order they run. transform replaces rotate,
+# distort and resize with --fast_transform
+STAGES = (
+    "render",
+    "rotate",
+    "distort",
+    "resize",
+    "transform",
+    "background",
+    "contrast",
+    "composite",
+    "blur",
+    "metadata",
+    "encode",
+    "write",
+)
+
+# The durations are counted in log spaced buckets, BUCKETS_PER_DECADE per
+# power of ten from MIN_DURATION seconds up to 100 seconds
+MIN_DURATION = 1e-6
+BUCKETS_PER_DECADE = 20
+BUCKET_COUNT = 8 * BUCKETS_PER_DECADE
+
+
+class StageTimer(object):
+    """
+    Time spent in each stage of one sample: lap(stage) is called at the end
+    of every stage and adds the time elapsed since the previous lap
+    """
+
+    __slots__ = ("durations", "last")
+
+    def __init__(self):
+        self.durations = {}
+        self.last = time.perf_counter()
+
+    def start(self) -> None:
+        self.last = time.perf_counter()
+
+    def lap(self, stage: str) -> None:
+        now = time.perf_counter()
+        self.durations[stage] = self.durations.get(stage, 0.0) + now - self.last
+        self.last = now
+
+
+class _NullTimer(object):
+    """
+    Stands for the timer when the stages are not timed
+    """
+
+    __slots__ = ()
+
+    def start(self) -> None:
+        pass
+
+    def lap(self, stage: str) -> None:
+        pass
+
+
+NULL_TIMER = _NullTimer()
+
+
+class StageHistogram(object):
+    """
+    Distribution of the durations of a stage, as bucket counts so that its
+    size does not grow with the number of samples
+    """
+
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.counts[_bucket(seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def merge(self, other: "StageHistogram") -> None:
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+
+    def percentile(self, q: float) -> float:
+        """
+        Duration under which q percent of the samples fall, at the resolution
+        of the buckets
+        """
+
+        rank = q / 100.0 * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                # Geometric middle of the bucket
+                return MIN_DURATION * 10 ** ((bucket + 0.5) / BUCKETS_PER_DECADE)
+        return 0.0
+
+
+class StageTimings(object):
+    """
+    Histograms of the durations of every stage over a run
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    def add(self, durations: Dict[str, float]) -> None:
+        """
+        Count the durations of one sample, as measured by a StageTimer
+        """
+
+        for stage, seconds in durations.items():
+            if stage not in self.stages:
+                self.stages[stage] = StageHistogram()
+            self.stages[stage].add(seconds)
+
+    def merge(self, other: "StageTimings") -> None:
+        """
+        Add the durations counted by other, e.g. by a writer stage
+        """
+
+        for stage, histogram in other.stages.items():
+            if stage not in self.stages:
+                self.stages[stage] = StageHistogram()
+            self.stages[stage].merge(histogram)
+
+    def summary(self) -> Dict[str, dict]:
+        """
+        Count, p50, p95 and total seconds of every stage that ran
+        """
+
+        return {
+            stage: {
+                "count": histogram.count,
+                "p50": histogram.percentile(50),
+                "p95": histogram.percentile(95),
+                "total": histogram.total,
+            }
+            for stage, histogram in sorted(
+                self.stages.items(), key=lambda item: _stage_order(item[0])
+            )
+        }
+
+    def write_json(self, path: str) -> None:
+        with open(path, "w", encoding="utf8") as f:
+            json.dump(self.summary(), f, indent=2)
+
+
+def format_timings(timings: StageTimings) -> str:
+    summary = timings.summary()
+    grand_total = sum(s["total"] for s in summary.values()) or 1.0
+    lines = [
+        "{:<12}{:>10}{:>12}{:>12}{:>12}{:>8}".format(
+            "stage", "samples", "p50 (ms)", "p95 (ms)", "total (s)", "share"
+        )
+    ]
+    for stage, s in summary.items():
+        lines.append(
+            "{:<12}{:>10}{:>12.3f}{:>12.3f}{:>12.2f}{:>8.1%}".format(
+                stage,
+                s["count"],
+                s["p50"] * 1000,
+                s["p95"] * 1000,
+                s["total"],
+                s["total"] / grand_total,
+            )
+        )
+    return "\n".join(lines)
+
+
+def _bucket(seconds: float) -> int:
+    if seconds <= MIN_DURATION:
+        return 0
+    bucket = int(math.log10(seconds / MIN_DURATION) * BUCKETS_PER_DECADE)
+    return min(bucket, BUCKET_COUNT - 1)
+
+
+def _stage_order(stage: str) -> int:
+    return STAGES.index(stage) if stage in STAGES else len(STAGES)
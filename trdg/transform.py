@@ -0,0 +1,98 @@
+"""
+Fast path of the geometric transforms: the skew rotation and the resize to
+the output size are composed into a single affine warp
+"""
+
+import math
+from typing import Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+
+def rotation_matrix(width: int, height: int, angle: float) -> Tuple:
+    """
+    Inverse affine matrix (from the rotated image to the original one) of
+    image.rotate(angle, expand=1) and the size of the rotated image, computed
+    the way PIL does
+    """
+
+    a = -math.radians(angle)
+    cos, sin = round(math.cos(a), 15), round(math.sin(a), 15)
+    matrix = np.array([[cos, sin, 0.0], [-sin, cos, 0.0]])
+
+    center = np.array([width / 2, height / 2])
+    matrix[:, 2] = matrix[:, :2] @ -center + center
+
+    corners = (
+        matrix[:, :2] @ np.array([[0, width, width, 0], [0, 0, height, height]])
+        + matrix[:, 2:]
+    )
+    rotated_width = math.ceil(corners[0].max()) - math.floor(corners[0].min())
+    rotated_height = math.ceil(corners[1].max()) - math.floor(corners[1].min())
+
+    matrix[:, 2] += matrix[:, :2] @ (
+        -(rotated_width - width) / 2.0,
+        -(rotated_height - height) / 2.0,
+    )
+    return matrix, (rotated_width, rotated_height)
+
+
+def rotate_and_resize(
+    image: Image, mask: Image, angle: float, length: int, orientation: int
+) -> Tuple:
+    """
+    Same as rotating image and mask by angle degrees (expand=1), then
+    resizing them to a height of length (horizontal text) or a width of
+    length (vertical text), but done in one warp at the output resolution.
+    The image is interpolated linearly with a premultiplied alpha, the mask
+    with the nearest neighbor so that its character colors are kept. mask
+    can be None.
+    """
+
+    matrix, (rotated_width, rotated_height) = rotation_matrix(
+        image.size[0], image.size[1], angle
+    )
+    if orientation == 0:
+        size = (int(rotated_width * (float(length) / float(rotated_height))), length)
+    else:
+        size = (
+            length,
+            int(float(rotated_height) * (float(length) / float(rotated_width))),
+        )
+
+    # Output pixel -> rotated image -> original image, then from coordinates
+    # where pixel centers are at .5 (PIL) to integer ones (OpenCV)
+    matrix[:, :2] = matrix[:, :2] @ np.diag(
+        (rotated_width / size[0], rotated_height / size[1])
+    )
+    matrix[:, 2] += matrix[:, :2] @ (0.5, 0.5) - 0.5
+
+    return (
+        _warp_rgba(image, matrix, size),
+        _warp(mask, matrix, size, cv2.INTER_NEAREST) if mask is not None else None,
+    )
+
+
+def _warp(image: Image, matrix: np.ndarray, size: Tuple, interpolation: int) -> Image:
+    return Image.fromarray(
+        cv2.warpAffine(
+            np.asarray(image),
+            matrix,
+            size,
+            flags=interpolation | cv2.WARP_INVERSE_MAP,
+            borderMode=cv2.BORDER_CONSTANT,
+            borderValue=0,
+        ),
+        image.mode,
+    )
+
+
+def _warp_rgba(image: Image, matrix: np.ndarray, size: Tuple) -> Image:
+    # Premultiplied, so that the transparent pixels do not darken the edges
+    # of the text, as PIL does when resizing
+    if image.mode != "RGBA":
+        image = image.convert("RGBA")
+    premultiplied = image.convert("RGBa")
+    return _warp(premultiplied, matrix, size, cv2.INTER_LINEAR).convert("RGBA")
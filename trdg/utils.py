@@ -2,6 +2,7 @@
 Utility functions
 """
 
+import io
 import os
 import re
 import unicodedata
@@ -10,6 +11,9 @@ from typing import List, Tuple
 import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 
+# Suffix of the files being written by write_files
+PARTIAL_EXTENSION = ".part"
+
 
 def load_dict(path: str) -> List[str]:
     """Read the dictionary file and returns all words in it."""
@@ -101,6 +105,134 @@ def mask_to_bboxes(mask: List[Tuple[int, int, int, int]], tess: bool = False):
     return bboxes
 
 
+def label_map_to_bboxes(
+    label_map: np.ndarray, tess: bool = False
+) -> List[Tuple[int, int, int, int]]:
+    """
+    Same bounding boxes as mask_to_bboxes, for a label map. The extent of
+    every character is found in one pass over the pixels instead of one per
+    character.
+    """
+
+    label_map = np.asarray(label_map)
+    height, width = label_map.shape
+    ys, xs = np.nonzero(label_map)
+    if len(ys) == 0:
+        return []
+    labels = label_map[ys, xs]
+    order = np.argsort(labels, kind="stable")
+    labels, ys, xs = labels[order], ys[order], xs[order]
+    starts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]])
+    extents = {
+        int(label): extent
+        for label, *extent in zip(
+            labels[starts].tolist(),
+            np.minimum.reduceat(xs, starts).tolist(),
+            np.minimum.reduceat(ys, starts).tolist(),
+            np.maximum.reduceat(xs, starts).tolist(),
+            np.maximum.reduceat(ys, starts).tolist(),
+        )
+    }
+
+    # As in mask_to_bboxes, a missing character is a space and is given a box
+    # between its neighbors, two missing characters in a row end the text
+    bboxes = []
+    space = False
+    label = 1
+    while True:
+        if label not in extents:
+            if space:
+                break
+            space = True
+            label += 1
+            continue
+        x_min, y_min, x_max, y_max = extents[label]
+        if space:
+            if not bboxes:
+                break
+            previous = bboxes[-1]
+            if not tess:
+                y1 = min(previous[3] + 1, y_min - 1)
+                y2 = max(previous[3] + 1, y_min - 2)
+            else:
+                y1 = min(height - y_min + 2, previous[1] - 1)
+                y2 = max(height - y_min + 2, previous[1] - 1)
+            bboxes.append(
+                (
+                    min(previous[2] + 1, x_min - 1),
+                    y1,
+                    max(previous[2] + 1, x_min - 2),
+                    y2,
+                )
+            )
+            space = False
+        bboxes.append(
+            (
+                max(0, x_min - 1),
+                max(0, y_min - 1) if not tess else max(0, height - y_max - 1),
+                min(width - 1, x_max + 1),
+                (
+                    min(height - 1, y_max + 1)
+                    if not tess
+                    else min(height - 1, height - y_min + 1)
+                ),
+            )
+        )
+        label += 1
+
+    return bboxes
+
+
+def mask_to_label_map(mask: Image) -> np.ndarray:
+    """
+    Decode the character colors of a mask into a uint16 label map, where the
+    pixels of the i-th character are i + 1 and the background 0
+    """
+
+    mask_arr = np.asarray(mask)
+    # The color of the i-th character is (_, (i + 1) // 255, (i + 1) % 255)
+    return mask_arr[..., 1].astype(np.uint16) * 255 + mask_arr[..., 2]
+
+
+def label_map_to_mask(label_map: np.ndarray) -> Image:
+    """
+    Encode a label map into the character colors of a mask, the inverse of
+    mask_to_label_map
+    """
+
+    label_map = np.asarray(label_map, dtype=np.int64)
+    mask_arr = np.empty(label_map.shape + (3,), dtype=np.uint8)
+    mask_arr[..., 0] = np.minimum(label_map // (255 * 255), 255)
+    # Clipped like the colors given to ImageDraw
+    mask_arr[..., 1] = np.minimum(label_map // 255, 255)
+    mask_arr[..., 2] = label_map % 255
+    return Image.fromarray(mask_arr)
+
+
+def derive_seed(seed: int, index: int) -> int:
+    """
+    Derive the seed of the sample at position index from the seed of the run.
+    Samples depend only on (seed, index), whatever the order they are made in.
+    """
+
+    return int(np.random.SeedSequence([seed, index]).generate_state(1)[0])
+
+
+def shard_range(count: int, shard_index: int, shard_count: int) -> Tuple[int, int]:
+    """
+    Bounds [start, end) of the contiguous range of indices rendered by a shard
+    when a dataset of count samples is split in shard_count shards
+    """
+
+    if shard_count < 1 or not 0 <= shard_index < shard_count:
+        raise ValueError("Invalid shard {} of {}".format(shard_index, shard_count))
+
+    return (
+        count * shard_index // shard_count,
+        count * (shard_index + 1) // shard_count,
+    )
+
+
 def draw_bounding_boxes(
     img: Image, bboxes: List[Tuple[int, int, int, int]], color: str = "green"
 ) -> None:
@@ -134,6 +266,44 @@ def make_filename_valid(value: str, allow_unicode: bool = False) -> str:
     return value[:200]
 
 
+def encode_image(image: Image, extension: str) -> bytes:
+    """
+    Encode an image in the format matching the file extension
+    """
+
+    image_format = Image.registered_extensions().get("." + extension.lower())
+    if image_format is None:
+        raise ValueError("unknown file extension: {}".format(extension))
+
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+def encode_array(array: np.ndarray) -> bytes:
+    """
+    Encode an array in the .npy format
+    """
+
+    buffer = io.BytesIO()
+    np.save(buffer, array)
+    return buffer.getvalue()
+
+
+def write_files(out_dir: str, files: List[Tuple[str, bytes]]) -> None:
+    """
+    Write (file name, content) pairs to out_dir. Every file is written under
+    a temporary name and then renamed, so that a run killed while writing
+    never leaves a truncated file behind (see --resume).
+    """
+
+    for file_name, content in files:
+        path = os.path.join(out_dir, file_name)
+        with open(path + PARTIAL_EXTENSION, "wb") as f:
+            f.write(content)
+        os.replace(path + PARTIAL_EXTENSION, path)
+
+
 def get_text_width(image_font: ImageFont, text: str) -> int:
     """
     Get the width of a string when rendered with a given font
@@ -0,0 +1,251 @@
+"""
+Writer stage: file I/O done by a pool of threads, decoupled from rendering
+"""
+
+import io
+import os
+import queue
+import tarfile
+import threading
+import time
+from typing import Callable, Iterable, Iterator, List, Tuple
+
+from trdg.timing import StageTimings
+from trdg.utils import write_files
+
+
+class SampleWriter(object):
+    """
+    Writes the encoded files of the samples to out_dir from thread_count
+    threads, fed through a queue of at most max_queue_size samples.
+    on_written is called with the record of a sample once its files are
+    written.
+
+    The time spent waiting on both ends of the queue tells which stage is the
+    bottleneck: the renderers wait for a free slot when writing is too slow
+    (I/O bound), the writer threads wait for samples when rendering is too
+    slow (CPU bound).
+
+    With timed set, the time spent writing every sample is counted as its
+    "write" stage in timings.
+    """
+
+    def __init__(
+        self,
+        out_dir: str,
+        thread_count: int = 4,
+        max_queue_size: int = 256,
+        on_written: Callable[[dict], None] = None,
+        timed: bool = False,
+    ):
+        self.out_dir = out_dir
+        self.on_written = on_written
+        self.timings = StageTimings() if timed else None
+        self.queue = queue.Queue(max_queue_size)
+        self.error = None
+
+        self.sample_count = 0
+        self.depth_sum = 0
+        self.depth_max = 0
+        self.put_wait = 0.0
+        self.get_wait = 0.0
+        self.lock = threading.Lock()
+
+        self.threads = [
+            threading.Thread(target=self._run, daemon=True)
+            for _ in range(max(thread_count, 1))
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def write(self, files: List[Tuple[str, bytes]], record: dict = None) -> None:
+        """
+        Queue the (file name, content) pairs of a sample, blocks while the
+        queue is full
+        """
+
+        if self.error is not None:
+            raise self.error
+
+        depth = self.queue.qsize()
+        self.depth_sum += depth
+        self.depth_max = max(self.depth_max, depth)
+        self.sample_count += 1
+
+        start = time.perf_counter()
+        self.queue.put((files, record))
+        self.put_wait += time.perf_counter() - start
+
+    def close(self) -> None:
+        """
+        Wait for the queued samples to be written and stop the threads
+        """
+
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+
+        if self.error is not None:
+            raise self.error
+
+    def stats(self) -> dict:
+        return {
+            "samples": self.sample_count,
+            "mean_queue_depth": self.depth_sum / max(self.sample_count, 1),
+            "max_queue_depth": self.depth_max,
+            "max_queue_size": self.queue.maxsize,
+            "render_wait_seconds": self.put_wait,
+            "writer_idle_seconds": self.get_wait / len(self.threads),
+        }
+
+    def _run(self) -> None:
+        while True:
+            start = time.perf_counter()
+            item = self.queue.get()
+            with self.lock:
+                self.get_wait += time.perf_counter() - start
+            if item is None:
+                return
+            files, record = item
+            try:
+                start = time.perf_counter()
+                write_files(self.out_dir, files)
+                if self.timings is not None:
+                    seconds = time.perf_counter() - start
+                    with self.lock:
+                        self.timings.add({"write": seconds})
+                if self.on_written is not None and record is not None:
+                    with self.lock:
+                        self.on_written(record)
+            except Exception as e:
+                self.error = e
+
+
+class InFlightLimit(object):
+    """
+    Bounds the number of samples between the task iterator and their write.
+    Pool.imap_unordered keeps the finished samples in the parent without
+    limit, and its workers keep taking tasks while the writes are behind, so
+    the tasks yielded by limit() wait for a free slot. The slot of a sample
+    is freed by release() once it is written.
+    """
+
+    def __init__(self, size: int):
+        self.slots = threading.BoundedSemaphore(max(size, 1))
+
+    def limit(self, tasks: Iterable) -> Iterator:
+        for task in tasks:
+            self.slots.acquire()
+            yield task
+
+    def release(self) -> None:
+        self.slots.release()
+
+
+def sample_members(
+    files: List[Tuple[str, bytes]], record: dict
+) -> List[Tuple[str, bytes]]:
+    """
+    Turn the files of a sample into (extension, content) pairs named after
+    the WebDataset conventions: "name.jpg" -> "jpg", "name_mask.png" ->
+    "mask.png", "name_boxes.txt" -> "boxes.txt". The label is added as "txt".
+    """
+
+    name = os.path.splitext(record["file"])[0]
+    members = []
+    for file_name, content in files:
+        members.append((file_name[len(name) + 1 :], content))
+    members.append(("txt", record["label"].encode("utf8")))
+    return members
+
+
+class TarShardWriter(object):
+    """
+    Streams the samples into tar shards of samples_per_shard samples each,
+    following the WebDataset layout: the files of a sample are stored next to
+    each other and share a key, e.g. 000000042.jpg, 000000042.mask.png,
+    000000042.boxes.txt and 000000042.txt for the label.
+
+    With timed set, the time spent writing every sample is counted as its
+    "write" stage in timings.
+    """
+
+    def __init__(
+        self,
+        out_dir: str,
+        samples_per_shard: int = 1000,
+        prefix: str = "samples",
+        timed: bool = False,
+    ):
+        if samples_per_shard <= 0:
+            raise ValueError("samples_per_shard must be positive")
+
+        self.out_dir = out_dir
+        self.timings = StageTimings() if timed else None
+        self.samples_per_shard = samples_per_shard
+        self.prefix = prefix
+        self.paths = []
+        self.tar = None
+        self.shard_sample_count = 0
+
+    def write(self, files: List[Tuple[str, bytes]], record: dict) -> None:
+        """
+        Add the (file name, content) pairs of a sample, as returned by
+        FakeTextDataGenerator.generate, to the current shard
+        """
+
+        start = time.perf_counter()
+        if self.tar is None or self.shard_sample_count >= self.samples_per_shard:
+            self._next_shard()
+
+        key = "{:09d}".format(record["index"])
+        for extension, content in sample_members(files, record):
+            self._add(key + "." + extension, content)
+        self.shard_sample_count += 1
+        if self.timings is not None:
+            self.timings.add({"write": time.perf_counter() - start})
+
+        # Where the sample is stored, for the manifest
+        record.update(shard=os.path.basename(self.paths[-1]), key=key)
+
+    def close(self) -> None:
+        if self.tar is not None:
+            self.tar.close()
+            self.tar = None
+
+    def _next_shard(self) -> None:
+        self.close()
+        path = os.path.join(
+            self.out_dir, "{}-{:06d}.tar".format(self.prefix, len(self.paths))
+        )
+        self.paths.append(path)
+        self.tar = tarfile.open(path, "w")
+        self.shard_sample_count = 0
+
+    def _add(self, name: str, content: bytes) -> None:
+        info = tarfile.TarInfo(name)
+        info.size = len(content)
+        # Fixed metadata so that a seeded run produces identical shards
+        info.mtime = 0
+        info.mode = 0o644
+        self.tar.addfile(info, io.BytesIO(content))
+
+
+def format_writer_stats(stats: dict) -> str:
+    return (
+        "Writer queue depth: {:.1f} mean, {} max (size {}). "
+        "Rendering waited {:.2f}s for the writers, "
+        "writers waited {:.2f}s for rendering ({})"
+    ).format(
+        stats["mean_queue_depth"],
+        stats["max_queue_depth"],
+        stats["max_queue_size"],
+        stats["render_wait_seconds"],
+        stats["writer_idle_seconds"],
+        (
+            "I/O bound"
+            if stats["render_wait_seconds"] > stats["writer_idle_seconds"]
+            else "CPU bound"
+        ),
+    )